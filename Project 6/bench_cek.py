@@ -0,0 +1,57 @@
+# Benchmark the CEK machine on deep expressions.
+#
+# A left-leaning chain ((((0 + 1) + 1) + ...) + 1) of N additions is too
+# deep for evaluate(); the CEK machine runs it in constant Python stack,
+# then again in slices of 1000 steps to show pausing and resuming. The
+# tail-recursive counter from bench_tail.py is run as well.
+#
+#   python bench_cek.py [N]
+
+from lang import *
+from cek import CEK
+from bench_tail import counter
+from machine import Machine
+
+import sys
+import time
+
+def chain(n):
+  e = IntExpr(0)
+  for _ in range(n):
+    e = AddExpr(e, IntExpr(1))
+  return e
+
+if __name__ == "__main__":
+  n = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 5
+
+  # The chain is built without resolve() and check(), which recurse too.
+  e = chain(n)
+
+  try:
+    Machine().run(e)
+    print("evaluate: ok")
+  except RecursionError:
+    print(f"evaluate: RecursionError (limit {sys.getrecursionlimit()})")
+
+  k = CEK(e)
+  t0 = time.perf_counter()
+  k.run()
+  t = time.perf_counter() - t0
+  assert k.value == n
+  print(f"cek:      {k.value} in {k.steps} steps, {t:.3f} s ({t / k.steps * 1e9:.0f} ns per step)")
+
+  k = CEK(e)
+  slices = 1
+  while not k.run(steps = 1000):
+    slices += 1
+  assert k.value == n
+  print(f"resumed:  {k.value} in {slices} slices of at most 1000 steps")
+
+  e = resolve(counter(n))
+  check(e)
+  k = CEK(e)
+  t0 = time.perf_counter()
+  k.run()
+  t = time.perf_counter() - t0
+  assert k.value == n
+  print(f"counter:  {k.value} in {k.steps} steps, {t:.3f} s ({t / n * 1e6:.2f} us per iteration)")
@@ -0,0 +1,43 @@
+# Benchmark the cost of @checked in debug and production mode.
+#
+# The mode is fixed at import time, so each mode runs in its own process:
+# resolve, check and evaluate an arithmetic tree, and report the best time.
+#
+#   python bench_checked.py [size] [runs]
+
+import os
+import subprocess
+import sys
+
+def run(size, runs):
+  from lang import resolve, check, evaluate
+  from bench_compile import program
+  import time
+
+  best = None
+  for _ in range(runs):
+    t0 = time.perf_counter()
+    e = resolve(program(size))
+    check(e)
+    evaluate(e)
+    t = time.perf_counter() - t0
+    best = t if best is None else min(best, t)
+  return best
+
+if __name__ == "__main__":
+  if len(sys.argv) > 1 and sys.argv[1] == "--child":
+    print(run(int(sys.argv[2]), int(sys.argv[3])))
+    sys.exit()
+
+  size = sys.argv[1] if len(sys.argv) > 1 else "10"
+  runs = sys.argv[2] if len(sys.argv) > 2 else "5"
+
+  times = {}
+  for mode, flag in [("debug", "0"), ("production", "1")]:
+    env = dict(os.environ, LANG_PRODUCTION = flag)
+    out = subprocess.run([sys.executable, __file__, "--child", size, runs],
+      env = env, capture_output = True, text = True, check = True)
+    times[mode] = float(out.stdout)
+    print(f"{mode + ':':12}{times[mode] * 1e3:.1f} ms")
+
+  print(f"overhead:   {times['debug'] / times['production']:.2f}x")
@@ -0,0 +1,37 @@
+# Benchmark columnar evaluation against calling evaluate() once per row.
+#
+#   \(x, y). if x < y then x * 2 + y else (x % 7) / y
+#
+#   python bench_columnar.py [ROWS]
+
+from lang import *
+from columnar import evaluate_batch
+from env import Env
+
+import numpy as np
+import sys
+import time
+
+if __name__ == "__main__":
+  n = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 5
+
+  x, y = VarDecl("x", int), VarDecl("y", int)
+  fn = resolve(LambdaExpr([x, y],
+    IfExpr(LtExpr("x", "y"), AddExpr(MulExpr("x", 2), "y"), DivExpr(RemExpr("x", 7), "y"))))
+  check(fn)
+
+  rng = np.random.default_rng(0)
+  xs = rng.integers(-1000, 1000, n)
+  # y is only zero in rows where x < y, whose branch never divides.
+  ys = rng.integers(1, 1000, n)
+  ys[xs < -500] = 0
+
+  t0 = time.perf_counter()
+  rows = [evaluate(fn.expr, Env({x: int(a), y: int(b)})) for a, b in zip(xs, ys)]
+  t1 = time.perf_counter()
+  cols = evaluate_batch(fn, [xs, ys])
+  t2 = time.perf_counter()
+
+  assert np.allclose(cols, rows)
+  print(f"evaluate: {n} rows in {t1 - t0:.3f} s")
+  print(f"batch:    {n} rows in {t2 - t1:.4f} s ({(t1 - t0) / (t2 - t1):.0f}x)")
@@ -0,0 +1,72 @@
+# Benchmark the closure compiler and the Python code generator against the
+# tree-walking evaluator.
+#
+#   python bench_compile.py [size] [runs]
+
+from lang import *
+from compiler import compile
+from codegen import codegen, CodeCache
+from heap import Heap
+from machine import Machine
+from env import Env
+
+import sys
+import tempfile
+import time
+
+def arith(n):
+  # A balanced tree of arithmetic and relational nodes over a parameter.
+  if n == 0:
+    return IdExpr("x")
+  return IfExpr(LtExpr(arith(n - 1), 1000), AddExpr(arith(n - 1), MulExpr("x", 2)), SubExpr("x", 1))
+
+def program(n):
+  # Call a lambda whose body is a large arithmetic tree with several
+  # different arguments, and collect the results in a record.
+  f = LambdaExpr([VarDecl("x", int)], arith(n))
+  g = LambdaExpr([VarDecl("f", FnType([int], int))], RecordExpr([
+    ("a", CallExpr("f", [1])),
+    ("b", CallExpr("f", [2])),
+    ("c", CallExpr("f", [3])),
+  ]))
+  return CallExpr(g, [f])
+
+def timed(fn, runs):
+  best = None
+  for _ in range(runs):
+    t0 = time.perf_counter()
+    v = fn()
+    t = time.perf_counter() - t0
+    best = t if best is None else min(best, t)
+  return best, v
+
+if __name__ == "__main__":
+  size = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+  runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+  e = resolve(program(size))
+  check(e)
+
+  t0 = time.perf_counter()
+  code = compile(e)
+  tc = time.perf_counter() - t0
+
+  root = tempfile.mkdtemp()
+  t0 = time.perf_counter()
+  codegen(e, CodeCache(root))
+  tg = time.perf_counter() - t0
+  t0 = time.perf_counter()
+  gen = codegen(e, CodeCache(root))
+  tw = time.perf_counter() - t0
+
+  t1, v1 = timed(lambda: evaluate(e, Env(), Machine()), runs)
+  t2, v2 = timed(lambda: code(Env(), Heap()), runs)
+  t3, v3 = timed(lambda: gen(Env(), Heap()), runs)
+  assert str(v1) == str(v2) == str(v3)
+
+  print(f"value:    {v2}")
+  print(f"compile:  {tc * 1e3:.2f} ms (once)")
+  print(f"codegen:  {tg * 1e3:.2f} ms cold, {tw * 1e3:.2f} ms from disk cache")
+  print(f"evaluate: {t1 * 1e3:.2f} ms")
+  print(f"compiled: {t2 * 1e3:.2f} ms ({t1 / t2:.2f}x)")
+  print(f"codegen:  {t3 * 1e3:.2f} ms ({t1 / t3:.2f}x)")
@@ -0,0 +1,72 @@
+# Micro-benchmark for node dispatch: the old chain of `type(e) is XExpr`
+# tests against a lookup in the shared dispatch table.
+#
+#   python bench_dispatch.py [depth] [repeat]
+
+from lang import *
+from evaluate import evaluator
+from walk import nodes
+
+import sys
+import timeit
+
+# The node kinds in the order the old if-chains tested them.
+chain = [
+  BoolExpr, AndExpr, OrExpr, NotExpr, IfExpr,
+  IntExpr, AddExpr, SubExpr, MulExpr, DivExpr, RemExpr, NegExpr,
+  EqExpr, NeExpr, LtExpr, GtExpr, LeExpr, GeExpr, IdExpr,
+  LambdaExpr, CallExpr,
+  NewExpr, DerefExpr, AssignExpr,
+  TupleExpr, ProjExpr, RecordExpr, MemberExpr, VariantExpr, CaseExpr,
+]
+
+def select_chain(e):
+  t = type(e)
+  for k in chain:
+    if t is k:
+      return k
+  assert False
+
+def select_table(e, table = evaluator.table):
+  return table[type(e)]
+
+v = VariantType([("x", int), ("y", int)])
+
+def mixed(depth):
+  # A deep tree that mixes cheap nodes near the front of the old chain with
+  # the variant and case nodes at its very end.
+  if depth == 0:
+    return IntExpr(1)
+  n = depth % 4
+  if n == 0:
+    return AddExpr(mixed(depth - 1), 1)
+  if n == 1:
+    return CaseExpr(VariantExpr(("x", mixed(depth - 1)), v), [
+      ("x", "a", "a"),
+      ("y", "b", "b"),
+    ])
+  if n == 2:
+    return IfExpr(LtExpr(0, 1), mixed(depth - 1), 0)
+  return MulExpr(mixed(depth - 1), 2)
+
+def run(fn, ns, repeat):
+  return min(timeit.repeat(lambda: [fn(n) for n in ns], number = 1, repeat = repeat))
+
+if __name__ == "__main__":
+  depth = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+  repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+  ns = list(nodes(mixed(depth)))
+  t1 = run(select_chain, ns, repeat)
+  t2 = run(select_table, ns, repeat)
+
+  print(f"nodes:  {len(ns)}")
+  print(f"chain:  {t1 / len(ns) * 1e9:.1f} ns/node")
+  print(f"table:  {t2 / len(ns) * 1e9:.1f} ns/node")
+  print(f"speedup: {t1 / t2:.2f}x")
+
+  for k in (IntExpr, AddExpr, VariantExpr, CaseExpr):
+    same = [n for n in ns if type(n) is k]
+    t1 = run(select_chain, same, repeat)
+    t2 = run(select_table, same, repeat)
+    print(f"  {k.__name__:12} chain {t1 / len(same) * 1e9:6.1f} ns  table {t2 / len(same) * 1e9:6.1f} ns")
@@ -0,0 +1,45 @@
+# Benchmark explicit substitutions against reduce().
+#
+#   (\(x). if x then x else B)(...(\(x). if x then x else B)(true)...)
+#
+# nested N deep, where B is a tree of about 2^D nodes over x that is never
+# taken. Every beta step of reduce() substitutes into B; reduce_explicit()
+# leaves it under a pending substitution that is never pushed.
+#
+#   python bench_explicit.py [N] [D]
+
+from lang import *
+from reduce import reduce
+from explicit import reduce_explicit
+
+import sys
+import time
+
+def tree(x, d):
+  if d == 0:
+    return IdExpr(x)
+  return AndExpr(tree(x, d - 1), NotExpr(tree(x, d - 1)))
+
+def dead(n, d):
+  e = BoolExpr(True)
+  for _ in range(n):
+    x = VarDecl("x", bool)
+    e = CallExpr(LambdaExpr([x], IfExpr("x", "x", tree("x", d))), [e])
+  return e
+
+if __name__ == "__main__":
+  n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+  d = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+  sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * n + 1000))
+
+  e = resolve(dead(n, d))
+
+  t0 = time.perf_counter()
+  v1 = reduce(e)
+  t1 = time.perf_counter()
+  v2, stats = reduce_explicit(e)
+  t2 = time.perf_counter()
+
+  assert str(v1) == str(v2)
+  print(f"reduce:   {t1 - t0:.3f} s")
+  print(f"explicit: {t2 - t1:.3f} s ({(t1 - t0) / (t2 - t1):.1f}x), {stats}")
@@ -0,0 +1,55 @@
+# Benchmark graph reduction with and without sharing.
+#
+#   dup:    (\(y). y and y)((\(y). y and y)(... (not true)))
+#   church: double(double(... one)) with double = \n.\f.\x. n(f)(n(f)(x)),
+#           applied to \b. not b and true, and also normalized on its own
+#
+# nested N deep. Without sharing, every duplicated argument is reduced once
+# per copy: 2^N times for dup.
+#
+#   python bench_graph.py [N]
+
+from lang import *
+from graph import reduce_graph
+
+import sys
+
+def dup(n):
+  e = NotExpr(True)
+  for _ in range(n):
+    e = CallExpr(LambdaExpr([VarDecl("y", bool)], AndExpr("y", "y")), [e])
+  return e
+
+def fn(x, body):
+  return LambdaExpr([VarDecl(x, bool)], body)
+
+def app(f, *args):
+  for a in args:
+    f = CallExpr(f, [a])
+  return f
+
+def church(n):
+  one = fn("f", fn("x", app("f", "x")))
+  double = fn("n", fn("f", fn("x", app("n", "f", app("n", "f", "x")))))
+  e = one
+  for _ in range(n):
+    e = app(double, e)
+  return e
+
+if __name__ == "__main__":
+  n = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+  sys.setrecursionlimit(max(sys.getrecursionlimit(), 100 * n + (10 << n)))
+
+  cases = [
+    ("dup, whnf", dup(n), False),
+    ("church, whnf", app(church(n), fn("b", NotExpr("b")), BoolExpr(True)), False),
+    ("church, normal form", church(n), True),
+  ]
+  for name, e, normal in cases:
+    e = resolve(e)
+    shared = reduce_graph(e, normal)
+    copied = reduce_graph(e, normal, share = False)
+    assert str(shared.value) == str(copied.value)
+    print(f"{name}:")
+    print(f"  shared: {shared.beta} beta steps in {shared.seconds:.3f} s")
+    print(f"  copied: {copied.beta} beta steps in {copied.seconds:.3f} s")
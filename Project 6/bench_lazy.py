@@ -0,0 +1,40 @@
+# Benchmark call-by-need on a call that ignores an expensive argument.
+#
+#   (\(x, y, z). if z then y else x + x)(<work>, <work>, false)
+#
+# where <work> is a balanced tree of 2^D additions. Eagerly both arguments
+# are evaluated; lazily only x is, and only once although the body uses it
+# twice.
+#
+#   python bench_lazy.py [D]
+
+from lang import *
+from machine import Machine
+import lazy
+
+import sys
+import time
+
+def work(d):
+  if d == 0:
+    return IntExpr(1)
+  return AddExpr(work(d - 1), work(d - 1))
+
+def program(d):
+  body = IfExpr("z", "y", AddExpr("x", "x"))
+  fn = LambdaExpr([VarDecl("x", int), VarDecl("y", int), VarDecl("z", bool)], body)
+  return CallExpr(fn, [work(d), work(d), False])
+
+if __name__ == "__main__":
+  d = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+
+  e = resolve(program(d))
+  check(e)
+
+  for mode in ["evaluate", "lazy"]:
+    m = Machine(evaluator = mode)
+    t0 = time.perf_counter()
+    v = m.run(e)
+    t = time.perf_counter() - t0
+    assert v == 2 << d
+    print(f"{mode + ':':10}{v} in {t:.3f} s")
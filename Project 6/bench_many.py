@@ -0,0 +1,34 @@
+# Benchmark run_many on a corpus of small independent programs.
+#
+#   python bench_many.py [PROGRAMS] [WORKERS]
+
+from lang import *
+from bench_tail import counter
+from runner import run_many
+
+import os
+import sys
+import time
+
+def corpus(n):
+  for i in range(n):
+    if i % 100 == 99:
+      # An ill-typed program, reported rather than fatal.
+      yield AddExpr(True, 1)
+    else:
+      yield counter(i % 50)
+
+if __name__ == "__main__":
+  n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+  workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+  for w in sorted({1, workers}):
+    t0 = time.perf_counter()
+    errors = 0
+    for r in run_many(corpus(n), workers = w, mode = "trampoline"):
+      if r.error:
+        errors += 1
+      else:
+        assert r.value == r.index % 50
+    t = time.perf_counter() - t0
+    print(f"{w:3} workers: {n} programs ({errors} errors) in {t:.2f} s")
@@ -0,0 +1,51 @@
+# Benchmark memoised calls on naive Fibonacci.
+#
+# The language has no recursive bindings, and tying the knot through a
+# reference would make fib impure, so fib recurses through a fixed-point
+# combinator instead. The program is not simply typed and is not checked.
+#
+#   fix = \(f). (\(x). f(\(v). x(x)(v)))(\(x). f(\(v). x(x)(v)))
+#   fix(\(self). \(n). if n < 2 then n else self(n - 1) + self(n - 2))(N)
+#
+#   python bench_memo.py [N]
+
+from lang import *
+from machine import Machine
+from memo import Memo
+
+import sys
+import time
+
+def var(x):
+  return VarDecl(x, None)
+
+def fix():
+  def half():
+    return LambdaExpr([var("x")],
+      CallExpr("f", [LambdaExpr([var("v")], CallExpr(CallExpr("x", ["x"]), ["v"]))]))
+  return LambdaExpr([var("f")], CallExpr(half(), [half()]))
+
+def fib(n):
+  gen = LambdaExpr([var("self")], LambdaExpr([var("n")],
+    IfExpr(LtExpr("n", 2),
+      "n",
+      AddExpr(CallExpr("self", [SubExpr("n", 1)]), CallExpr("self", [SubExpr("n", 2)])))))
+  return CallExpr(CallExpr(fix(), [gen]), [n])
+
+if __name__ == "__main__":
+  n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+  sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+
+  e = resolve(fib(n))
+
+  t0 = time.perf_counter()
+  v1 = Machine().run(e)
+  t1 = time.perf_counter()
+  m = Machine(evaluator = "memo", memo = Memo(1024))
+  v2 = m.run(e)
+  t2 = time.perf_counter()
+
+  assert v1 == v2
+  print(f"evaluate: fib({n}) = {v1} in {t1 - t0:.3f} s")
+  print(f"memo:     fib({n}) = {v2} in {t2 - t1:.4f} s")
+  print(m.memo)
@@ -0,0 +1,76 @@
+# Memory taken by the AST, in bytes per node.
+#
+# A random well-typed program of about N nodes from generator.py is built,
+# resolved and checked under tracemalloc. Everything still allocated after
+# that, divided by the number of nodes, is what a node costs together with
+# its share of declarations, types and child lists.
+#
+# Given a git revision, the same measurement is also made on this directory
+# as it was at that revision, to compare. Each measurement runs in its own
+# process.
+#
+#   python bench_memory.py [N] [revision] [seed]
+#   python bench_memory.py 1000000 HEAD~1
+
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+def measure(n, seed):
+  from lang import resolve, check
+  from generator import Generator
+  from walk import nodes
+  import tracemalloc
+
+  tracemalloc.start()
+  e = Generator(seed).program(n)
+  resolve(e)
+  check(e)
+  used = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  return used, sum(1 for _ in nodes(e))
+
+def run(dir, n, seed):
+  out = subprocess.run([sys.executable, os.path.join(dir, os.path.basename(__file__)),
+    "--child", str(n), str(seed)], cwd = dir, capture_output = True, text = True, check = True)
+  used, count = map(int, out.stdout.split())
+  return used, count
+
+def export(rev, dir):
+  # This directory as it was at rev, with this script added.
+  here = os.path.dirname(os.path.abspath(__file__))
+  def git(*args):
+    return subprocess.run(["git", *args], cwd = here, capture_output = True, check = True).stdout
+  top = git("rev-parse", "--show-toplevel").decode().strip()
+  prefix = git("rev-parse", "--show-prefix").decode().strip()
+  tar = subprocess.run(["git", "archive", "--format=tar", f"{rev}:{prefix}"],
+    cwd = top, capture_output = True, check = True).stdout
+  with tarfile.open(fileobj = io.BytesIO(tar)) as t:
+    t.extractall(dir)
+  shutil.copy(__file__, dir)
+
+def show(name, used, count):
+  print(f"{name:>10}: {count} nodes, {used / 2 ** 20:8.1f} MiB, {used / count:6.1f} bytes/node")
+
+if __name__ == "__main__":
+  if len(sys.argv) > 1 and sys.argv[1] == "--child":
+    print(*measure(int(sys.argv[2]), int(sys.argv[3])))
+    sys.exit()
+
+  n = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+  rev = sys.argv[2] if len(sys.argv) > 2 else None
+  seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+  after = run(os.path.dirname(os.path.abspath(__file__)), n, seed)
+  if rev is not None:
+    with tempfile.TemporaryDirectory() as dir:
+      export(rev, dir)
+      before = run(dir, n, seed)
+    show(rev, *before)
+  show("current", *after)
+  if rev is not None:
+    print(f"{'saved':>10}: {1 - after[0] / before[0]:.0%}")
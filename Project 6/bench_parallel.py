@@ -0,0 +1,42 @@
+# Benchmark parallel reduction against step() from the root.
+#
+#   a balanced tree of ands and ors, D deep, whose leaves are
+#   (\(x). not x)(true)
+#
+# step() makes one traversal per redex, about 2^(D+1) of them; a parallel
+# step contracts a whole level of the tree per traversal.
+#
+#   python bench_parallel.py [D]
+
+from lang import *
+from reduce import reduce_iter
+from parallel import reduce_parallel
+
+import sys
+import time
+
+def tree(d):
+  if d == 0:
+    return CallExpr(LambdaExpr([VarDecl("x", bool)], NotExpr("x")), [True])
+  if d % 2:
+    return AndExpr(tree(d - 1), tree(d - 1))
+  return OrExpr(tree(d - 1), tree(d - 1))
+
+if __name__ == "__main__":
+  d = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+  e = resolve(tree(d))
+
+  t0 = time.perf_counter()
+  v1 = e
+  k = 0
+  for v1 in reduce_iter(e):
+    k += 1
+  t1 = time.perf_counter()
+  v2, covered = reduce_parallel(e)
+  t2 = time.perf_counter()
+
+  assert str(v1) == str(v2) and sum(covered) == k
+  print(f"step:     {k} traversals in {t1 - t0:.3f} s")
+  print(f"parallel: {len(covered)} traversals in {t2 - t1:.3f} s ({(t1 - t0) / (t2 - t1):.0f}x)")
+  print(f"steps covered per traversal: {covered}")
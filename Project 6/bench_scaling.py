@@ -0,0 +1,33 @@
+# How resolve, check and evaluate scale with program size, on random
+# well-typed programs from generator.py.
+#
+#   python bench_scaling.py [max nodes] [seed]
+
+from lang import *
+from generator import Generator
+from walk import nodes
+
+import sys
+import time
+
+if __name__ == "__main__":
+  top = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 5
+  seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+  n = 10
+  print(f"{'target':>9} {'nodes':>9} {'resolve':>9} {'check':>9} {'evaluate':>9}   us/node")
+  while n <= top:
+    e = Generator(seed).program(n)
+    size = sum(1 for _ in nodes(e))
+
+    t0 = time.perf_counter()
+    resolve(e)
+    t1 = time.perf_counter()
+    check(e)
+    t2 = time.perf_counter()
+    evaluate(e)
+    t3 = time.perf_counter()
+
+    per = (t3 - t0) / size * 1e6
+    print(f"{n:>9} {size:>9} {t1 - t0:>9.4f} {t2 - t1:>9.4f} {t3 - t2:>9.4f}   {per:.2f}")
+    n *= 10
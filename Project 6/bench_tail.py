@@ -0,0 +1,51 @@
+# Benchmark proper tail calls on a tail-recursive counter.
+#
+# The language has no recursive bindings, so the counter ties the knot
+# through a reference:
+#
+#   (\(r). {r = \(n, acc). if n == 0 then acc else (*r)(n - 1, acc + 1),
+#           (*r)(N, 0)}.1) (new \(n, acc). acc)
+#
+#   python bench_tail.py [N]
+
+from lang import *
+from machine import Machine
+import trampoline
+
+import sys
+import time
+
+fn = FnType([int, int], int)
+
+def counter(n):
+  r = VarDecl("r", RefType(fn))
+  loop = LambdaExpr([VarDecl("n", int), VarDecl("acc", int)],
+    IfExpr(EqExpr("n", 0),
+      "acc",
+      CallExpr(DerefExpr("r"), [SubExpr("n", 1), AddExpr("acc", 1)])))
+  body = ProjExpr(TupleExpr([
+    AssignExpr("r", loop),
+    CallExpr(DerefExpr("r"), [n, 0]),
+  ]), 1)
+  init = LambdaExpr([VarDecl("n", int), VarDecl("acc", int)], "acc")
+  return CallExpr(LambdaExpr([r], body), [NewExpr(init)])
+
+if __name__ == "__main__":
+  n = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+
+  e = resolve(counter(n))
+  check(e)
+
+  try:
+    Machine().run(e)
+    print("evaluate:   ok")
+  except RecursionError:
+    print(f"evaluate:   RecursionError (limit {sys.getrecursionlimit()})")
+
+  m = Machine(evaluator = "trampoline")
+  t0 = time.perf_counter()
+  v = m.run(e)
+  t = time.perf_counter() - t0
+  assert v == n
+
+  print(f"trampoline: {v} in {t:.2f} s ({t / n * 1e6:.2f} us per iteration)")
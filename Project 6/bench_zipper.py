@@ -0,0 +1,41 @@
+# Benchmark the focused reducer against step() from the root.
+#
+#   f(f(...f(true)...)) with f = \(x). not x, nested N deep
+#
+# Every redex is at depth about N, so each step() from the root rebuilds
+# about N nodes; the zipper rebuilds a constant number.
+#
+#   python bench_zipper.py [N]
+
+from lang import *
+from reduce import step, is_value
+from zipper import reduce_focused
+
+import sys
+import time
+
+def nots(n):
+  e = BoolExpr(True)
+  for _ in range(n):
+    e = CallExpr(LambdaExpr([VarDecl("x", bool)], NotExpr("x")), [e])
+  return e
+
+if __name__ == "__main__":
+  n = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+  sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * n + 1000))
+
+  e = resolve(nots(n))
+
+  t0 = time.perf_counter()
+  v1 = e
+  k = 0
+  while not is_value(v1):
+    v1 = step(v1)
+    k += 1
+  t1 = time.perf_counter()
+  v2 = reduce_focused(e)
+  t2 = time.perf_counter()
+
+  assert str(v1) == str(v2)
+  print(f"step:   {k} steps in {t1 - t0:.3f} s")
+  print(f"zipper: {k} steps in {t2 - t1:.3f} s ({(t1 - t0) / (t2 - t1):.0f}x)")
@@ -0,0 +1,270 @@
+# The benchmark suite.
+#
+# Every workload builds a program of a given size and times one pass over
+# it: resolve, check, evaluate, reduce or subst. Each workload is run
+# `runs` times for the best and mean time, and once more under tracemalloc
+# for the peak memory it allocates. A fresh program is built before every
+# run, outside the timing, because resolve and check record their results
+# in the tree.
+#
+#   python benchmarks.py                          # print the results
+#   python benchmarks.py --json out.json          # and save them
+#   python benchmarks.py --baseline out.json      # and compare, failing
+#                                                 # on a regression
+#   python benchmarks.py --scale 4 --only evaluate
+#
+# A workload regresses when its best time exceeds the baseline's by more
+# than --threshold (10% by default). The exit status is 1 if any did.
+# Debug-mode @checked dominates some workloads, so compare runs made in the
+# same mode (see checking.py).
+
+from lang import *
+from machine import Machine
+from reduce import reduce
+from sinks import Count
+
+import argparse
+import checking
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+
+# Programs
+
+def chain(n):
+  # ((x + 1) * 2 - ...) nested n deep, on the left.
+  e = IdExpr("x")
+  ops = [AddExpr, MulExpr, SubExpr]
+  for i in range(n):
+    e = ops[i % 3](e, (i % 7) + 1)
+  return CallExpr(LambdaExpr([VarDecl("x", int)], e), [1])
+
+def wide_tuple(n):
+  return ProjExpr(TupleExpr([AddExpr(i, 1) for i in range(n)]), n - 1)
+
+def wide_record(n):
+  r = RecordExpr([(f"f{i}", LtExpr(i, n // 2)) for i in range(n)])
+  return MemberExpr(r, f"f{n - 1}")
+
+def closures(n):
+  # \(a0). \(a1). ... a0 + a1 + ..., applied to one argument at a time.
+  vs = [VarDecl(f"a{i}", int) for i in range(n)]
+  body = IdExpr("a0")
+  for i in range(1, n):
+    body = AddExpr(body, f"a{i}")
+  for v in reversed(vs):
+    body = LambdaExpr([v], body)
+  for i in range(n):
+    body = CallExpr(body, [i])
+  return body
+
+def references(n):
+  # (\(r). {r = *r + 1, ..., new 0, ..., *r}.k)(new 0)
+  es = []
+  for i in range(n):
+    es += [AssignExpr("r", AddExpr(DerefExpr("r"), 1))]
+    es += [NewExpr(i)]
+  es += [DerefExpr("r")]
+  body = ProjExpr(TupleExpr(es), len(es) - 1)
+  return CallExpr(LambdaExpr([VarDecl("r", RefType(int))], body), [NewExpr(0)])
+
+def variants(n):
+  t = VariantType([("a", int), ("b", bool)])
+  cases = []
+  for i in range(n):
+    v = VariantExpr(("a", i), t) if i % 2 else VariantExpr(("b", i % 3 == 0), t)
+    cases += [CaseExpr(v, [
+      ("a", "x", AddExpr("x", 1)),
+      ("b", "y", IfExpr("y", 1, 0)),
+    ])]
+  return ProjExpr(TupleExpr(cases), n - 1)
+
+def nots(n):
+  # f(f(...f(true)...)) with f = \(x). not x, a fresh lambda at each call.
+  e = BoolExpr(True)
+  for _ in range(n):
+    e = CallExpr(LambdaExpr([VarDecl("x", bool)], NotExpr("x")), [e])
+  return e
+
+def boolean(n):
+  # A balanced and/or tree over x with 2^n leaves, inside a lambda.
+  def tree(d):
+    if d == 0:
+      return IdExpr("x")
+    op = AndExpr if d % 2 else OrExpr
+    return op(tree(d - 1), NotExpr(tree(d - 1)))
+  return LambdaExpr([VarDecl("x", bool)], tree(n))
+
+
+def sparse(n):
+  # A lambda whose body is a tree of 2^n closed boolean leaves and one use
+  # of its parameter.
+  def tree(d):
+    if d == 0:
+      return BoolExpr(d % 2 == 0)
+    op = AndExpr if d % 2 else OrExpr
+    return op(tree(d - 1), NotExpr(tree(d - 1)))
+  return LambdaExpr([VarDecl("x", bool)], AndExpr("x", tree(n)))
+
+
+# Passes
+
+def resolved(build):
+  def setup(n):
+    e = resolve(build(n))
+    return e
+  return setup
+
+def checked_program(build):
+  def setup(n):
+    e = resolve(build(n))
+    check(e)
+    return e
+  return setup
+
+def run_resolve(e):
+  resolve(e)
+
+def run_check(e):
+  check(e)
+
+def run_evaluate(e):
+  Machine().run(e)
+
+def run_evaluate_gc(e):
+  Machine(threshold = 256).run(e)
+
+def run_reduce(e):
+  reduce(e, Count())
+
+def run_subst(fn):
+  subst(fn.expr, {fn.vars[0]: BoolExpr(True)})
+
+def run_subst_twice(fn):
+  # The second substitution finds the free variables already cached.
+  subst(fn.expr, {fn.vars[0]: BoolExpr(True)})
+  subst(fn.expr, {fn.vars[0]: BoolExpr(False)})
+
+
+class Workload:
+  def __init__(self, name, phase, size, setup, run):
+    self.name = name
+    self.phase = phase
+    self.size = size
+    self.setup = setup
+    self.run = run
+
+workloads = [
+  Workload("resolve/chain", "resolve", 1000, chain, run_resolve),
+  Workload("resolve/closures", "resolve", 400, closures, run_resolve),
+  Workload("check/chain", "check", 1000, resolved(chain), run_check),
+  Workload("check/wide-record", "check", 10000, resolved(wide_record), run_check),
+  Workload("check/variants", "check", 5000, resolved(variants), run_check),
+  Workload("evaluate/chain", "evaluate", 1000, checked_program(chain), run_evaluate),
+  Workload("evaluate/wide-tuple", "evaluate", 20000, checked_program(wide_tuple), run_evaluate),
+  Workload("evaluate/wide-record", "evaluate", 20000, checked_program(wide_record), run_evaluate),
+  Workload("evaluate/closures", "evaluate", 400, checked_program(closures), run_evaluate),
+  Workload("evaluate/references", "evaluate", 10000, checked_program(references), run_evaluate),
+  Workload("evaluate/references-gc", "evaluate", 10000, checked_program(references), run_evaluate_gc),
+  Workload("evaluate/variants", "evaluate", 10000, checked_program(variants), run_evaluate),
+  Workload("reduce/nots", "reduce", 120, checked_program(nots), run_reduce),
+  Workload("subst/boolean", "subst", 14, resolved(boolean), run_subst),
+  Workload("subst/sparse", "subst", 14, resolved(sparse), run_subst_twice),
+]
+
+
+def measure(w, scale, runs):
+  n = max(1, int(w.size * scale))
+  times = []
+  for _ in range(runs):
+    x = w.setup(n)
+    # As timeit does, keep Python's cycle collector out of the timing.
+    gc.collect()
+    gc.disable()
+    try:
+      t0 = time.perf_counter()
+      w.run(x)
+      times += [time.perf_counter() - t0]
+    finally:
+      gc.enable()
+
+  x = w.setup(n)
+  tracemalloc.start()
+  w.run(x)
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+
+  return {
+    "phase": w.phase,
+    "size": n,
+    "runs": runs,
+    "best": min(times),
+    "mean": sum(times) / len(times),
+    "peak_bytes": peak,
+  }
+
+def compare(results, baseline, threshold):
+  # Names of the workloads slower than the baseline by more than threshold.
+  if baseline.get("production") != checking.production:
+    print("warning: the baseline was run with @checked in the other mode")
+  slower = []
+  for name, r in results.items():
+    b = baseline.get("results", {}).get(name)
+    if b is None or b["size"] != r["size"]:
+      continue
+    ratio = r["best"] / b["best"]
+    r["baseline"] = b["best"]
+    r["ratio"] = ratio
+    if ratio > 1 + threshold:
+      slower += [name]
+  return slower
+
+def main(argv = None):
+  p = argparse.ArgumentParser(description = "Benchmark the passes of the language.")
+  p.add_argument("--runs", type = int, default = 5)
+  p.add_argument("--scale", type = float, default = 1.0)
+  p.add_argument("--only", help = "run only workloads whose name contains this")
+  p.add_argument("--json", help = "write the results to this file")
+  p.add_argument("--baseline", help = "compare against results saved with --json")
+  p.add_argument("--threshold", type = float, default = 0.10)
+  args = p.parse_args(argv)
+
+  sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+
+  results = {}
+  for w in workloads:
+    if args.only and args.only not in w.name:
+      continue
+    results[w.name] = measure(w, args.scale, args.runs)
+
+  slower = []
+  if args.baseline:
+    with open(args.baseline) as f:
+      slower = compare(results, json.load(f), args.threshold)
+
+  for name, r in results.items():
+    line = f"{name:<28} n={r['size']:<6} best {r['best'] * 1e3:9.2f} ms  " \
+      f"mean {r['mean'] * 1e3:9.2f} ms  peak {r['peak_bytes'] / 1024:9.0f} KiB"
+    if "ratio" in r:
+      line += f"  {r['ratio']:5.2f}x baseline"
+      if name in slower:
+        line += "  REGRESSION"
+    print(line)
+
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump({
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "production": checking.production,
+        "results": results,
+      }, f, indent = 2)
+
+  return 1 if slower else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
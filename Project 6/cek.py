@@ -0,0 +1,304 @@
+from lang import *
+from dispatch import Table
+from env import Env
+from evaluate import Closure, Tuple, Field, Record, Variant
+from heap import Location, tracer
+from machine import Machine
+
+import operator
+
+# A CEK machine.
+#
+# The evaluator in evaluate.py uses the Python stack as its continuation,
+# so deep expressions overflow it. The CEK machine keeps its own
+# continuation, a list of small tuples, and runs in a single loop: the
+# state is either an expression to evaluate in an environment, or a value
+# to hand to the innermost continuation frame. Nesting depth is limited
+# only by memory, node kinds are told apart with one dict lookup, and most
+# steps make no Python call at all.
+#
+# Because the whole state lives on the object, a run can be paused after a
+# number of steps and resumed later:
+#
+#   k = CEK(e)
+#   while not k.run(steps = 10000):
+#     ...
+#   k.value
+
+# What to do when evaluating each kind of node.
+LITERAL, ID, LAMBDA, BINARY, UNARY, IF, CALL, NEW, DEREF, ASSIGN, \
+  TUPLE, PROJ, RECORD, MEMBER, VARIANT, CASE = range(16)
+
+# Continuation frames, tagged by their first element.
+K_RHS, K_BINARY, K_UNARY, K_IF, K_FN, K_ARG, K_NEW, K_DEREF, K_ASSIGN, \
+  K_STORE, K_ELEM, K_PROJ, K_FIELD, K_MEMBER, K_VARIANT, K_CASE = range(16)
+
+codes = Table("cek", {
+  BoolExpr: LITERAL, IntExpr: LITERAL,
+  IdExpr: ID,
+  LambdaExpr: LAMBDA,
+  AndExpr: BINARY, OrExpr: BINARY,
+  AddExpr: BINARY, SubExpr: BINARY, MulExpr: BINARY, DivExpr: BINARY, RemExpr: BINARY,
+  EqExpr: BINARY, NeExpr: BINARY, LtExpr: BINARY, GtExpr: BINARY, LeExpr: BINARY, GeExpr: BINARY,
+  NotExpr: UNARY, NegExpr: UNARY,
+  IfExpr: IF,
+  CallExpr: CALL,
+  NewExpr: NEW, DerefExpr: DEREF, AssignExpr: ASSIGN,
+  TupleExpr: TUPLE, ProjExpr: PROJ,
+  RecordExpr: RECORD, MemberExpr: MEMBER,
+  VariantExpr: VARIANT, CaseExpr: CASE,
+})
+
+# As in evaluate.py, both operands of `and` and `or` are evaluated.
+binary = {
+  AndExpr: lambda v1, v2: v1 and v2,
+  OrExpr: lambda v1, v2: v1 or v2,
+  AddExpr: operator.add,
+  SubExpr: operator.sub,
+  MulExpr: operator.mul,
+  DivExpr: operator.truediv,
+  RemExpr: operator.mod,
+  EqExpr: operator.eq,
+  NeExpr: operator.ne,
+  LtExpr: operator.lt,
+  GtExpr: operator.gt,
+  LeExpr: operator.le,
+  GeExpr: operator.ge,
+}
+
+unary = {
+  NotExpr: operator.not_,
+  NegExpr: operator.neg,
+}
+
+# Continuation frames are traced like any other value; AST nodes in them
+# have no tracer and are skipped.
+tracer.register(tuple)(lambda f: f)
+
+
+class CEK:
+
+  def __init__(self, e : Expr, stack : Env = None, m : Machine = None):
+    self.m = m or Machine()
+    self.control = e
+    self.env = stack if stack is not None else Env()
+    self.value = None
+    self.kont = []
+    self.evaluating = True
+    self.done = False
+    self.steps = 0
+    # The paused state, while it is on the heap's roots.
+    self.live = None
+
+  def run(self, steps = None):
+    # Runs until the value is known, or for at most `steps` steps. Returns
+    # whether evaluation has finished.
+    if self.done:
+      return True
+
+    e, env, v, k = self.control, self.env, self.value, self.kont
+    evaluating = self.evaluating
+    heap = self.m.heap
+    cells = heap.cells
+    n = self.steps
+    stop = n + steps if steps is not None else -1
+
+    # The continuation holds every environment and value still needed, and
+    # a value being allocated is rooted by alloc() itself. Between runs the
+    # whole paused state stays rooted, until the machine is done.
+    if self.live is None:
+      self.live = [k]
+      heap.roots.append(self.live)
+    try:
+      while n != stop:
+        n += 1
+
+        if evaluating:
+          op = codes[type(e)]
+
+          if op is LITERAL:
+            v = e.value
+            evaluating = False
+          elif op is ID:
+            v = env.lookup(e)
+            evaluating = False
+          elif op is BINARY:
+            k.append((K_RHS, e, env))
+            e = e.lhs
+          elif op is IF:
+            k.append((K_IF, e, env))
+            e = e.cond
+          elif op is CALL:
+            k.append((K_FN, e, env))
+            e = e.fn
+          elif op is LAMBDA:
+            v = Closure(e, env)
+            evaluating = False
+          elif op is UNARY:
+            k.append((K_UNARY, unary[type(e)]))
+            e = e.expr
+          elif op is CASE:
+            k.append((K_CASE, e, env))
+            e = e.expr
+          elif op is NEW:
+            k.append((K_NEW,))
+            e = e.expr
+          elif op is DEREF:
+            k.append((K_DEREF,))
+            e = e.expr
+          elif op is ASSIGN:
+            k.append((K_ASSIGN, e, env))
+            e = e.rhs
+          elif op is TUPLE:
+            if e.elems:
+              k.append((K_ELEM, e, env, []))
+              e = e.elems[0]
+            else:
+              v = Tuple([])
+              evaluating = False
+          elif op is PROJ:
+            k.append((K_PROJ, e.index))
+            e = e.obj
+          elif op is RECORD:
+            if e.fields:
+              k.append((K_FIELD, e, env, []))
+              e = e.fields[0].value
+            else:
+              v = Record([])
+              evaluating = False
+          elif op is MEMBER:
+            k.append((K_MEMBER, e.id))
+            e = e.obj
+          else:
+            k.append((K_VARIANT, e.field.id))
+            e = e.field.value
+          continue
+
+        if not k:
+          self.done = True
+          break
+
+        f = k.pop()
+        tag = f[0]
+
+        if tag is K_RHS:
+          x = f[1]
+          k.append((K_BINARY, binary[type(x)], v))
+          e = x.rhs
+          env = f[2]
+          evaluating = True
+        elif tag is K_BINARY:
+          v = f[1](f[2], v)
+        elif tag is K_IF:
+          x = f[1]
+          e = x.true if v else x.false
+          env = f[2]
+          evaluating = True
+        elif tag is K_FN:
+          if type(v) is not Closure:
+            raise Exception("cannot apply a non-closure to an argument")
+          x = f[1]
+          if x.args:
+            k.append((K_ARG, x, f[2], v, []))
+            e = x.args[0]
+            env = f[2]
+          else:
+            e = v.abs.expr
+            env = v.env.bind(v.abs.vars, [])
+          evaluating = True
+        elif tag is K_ARG:
+          x, c, args = f[1], f[3], f[4]
+          args.append(v)
+          if len(args) < len(x.args):
+            k.append(f)
+            e = x.args[len(args)]
+            env = f[2]
+          else:
+            # The body is not wrapped in a frame: calls in tail position
+            # leave the continuation as it was.
+            e = c.abs.expr
+            env = c.env.bind(c.abs.vars, args)
+          evaluating = True
+        elif tag is K_UNARY:
+          v = f[1](v)
+        elif tag is K_CASE:
+          case = None
+          for c in f[1].cases:
+            if c.id == v.tag:
+              case = c
+              break
+          assert case != None
+          e = case.expr
+          env = f[2].bind((case.var,), [v.value])
+          evaluating = True
+        elif tag is K_NEW:
+          v = heap.alloc(v)
+        elif tag is K_DEREF:
+          if type(v) is not Location:
+            raise Exception("invalid reference")
+          v = cells[v.index]
+        elif tag is K_ASSIGN:
+          k.append((K_STORE, v))
+          e = f[1].lhs
+          env = f[2]
+          evaluating = True
+        elif tag is K_STORE:
+          if type(v) is not Location:
+            raise Exception("invalid reference")
+          cells[v.index] = f[1]
+          v = None
+        elif tag is K_ELEM:
+          x, vs = f[1], f[3]
+          vs.append(v)
+          if len(vs) < len(x.elems):
+            k.append(f)
+            e = x.elems[len(vs)]
+            env = f[2]
+            evaluating = True
+          else:
+            v = Tuple(vs)
+        elif tag is K_PROJ:
+          v = v.values[f[1]]
+        elif tag is K_FIELD:
+          x, fs = f[1], f[3]
+          fs.append(Field(x.fields[len(fs)].id, v))
+          if len(fs) < len(x.fields):
+            k.append(f)
+            e = x.fields[len(fs)].value
+            env = f[2]
+            evaluating = True
+          else:
+            v = Record(fs)
+        elif tag is K_MEMBER:
+          v = v.select[f[1]]
+        else:
+          v = Variant(f[1], v)
+    except BaseException:
+      self.unroot()
+      raise
+    finally:
+      self.control, self.env, self.value = e, env, v
+      self.evaluating = evaluating
+      self.steps = n
+      if self.done:
+        self.unroot()
+      elif self.live is not None:
+        self.live[:] = [k, env, v]
+
+    return self.done
+
+  def unroot(self):
+    # Other runs may have rooted values since, so the entry is found by
+    # identity rather than popped.
+    roots = self.m.heap.roots
+    for i in range(len(roots) - 1, -1, -1):
+      if roots[i] is self.live:
+        del roots[i]
+        break
+    self.live = None
+
+
+def evaluate_cek(e : Expr, stack : Env = None, m : Machine = None):
+  k = CEK(e, stack, m)
+  k.run()
+  return k.value
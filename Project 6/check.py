@@ -1,4 +1,7 @@
 from lang import *
+from dispatch import Dispatch
+
+checker = Dispatch("check")
 
 
 @checked
@@ -14,6 +17,8 @@ def is_same_type(t1 : Type, t2 : Type):
     return True
 
   if type(t1) is FnType:
+    if len(t1.parms) != len(t2.parms):
+      return False
     for a, b in zip(t1.parms, t2.parms):
       if not is_same_type(a, b):
         return False
@@ -22,6 +27,22 @@ def is_same_type(t1 : Type, t2 : Type):
   if type(t1) is RefType:
     return is_same_type(t1.ref, t2.ref)
 
+  if type(t1) is TupleType:
+    if len(t1.elems) != len(t2.elems):
+      return False
+    for a, b in zip(t1.elems, t2.elems):
+      if not is_same_type(a, b):
+        return False
+    return True
+
+  if type(t1) is RecordType or type(t1) is VariantType:
+    if len(t1.fields) != len(t2.fields):
+      return False
+    for a, b in zip(t1.fields, t2.fields):
+      if a.id != b.id or not is_same_type(a.type, b.type):
+        return False
+    return True
+
   assert False
 
 @checked
@@ -68,10 +89,12 @@ def has_bool(e : Expr):
 def has_int(e : Expr):
   return is_same_type(check(e), intType)
 
+@checker.register(BoolExpr)
 @checked
 def check_bool(e : Expr):
   return boolType
 
+@checker.register(IntExpr)
 @checked
 def check_int(e : Expr):
 
@@ -80,7 +103,7 @@ def check_int(e : Expr):
 @checked
 def check_logical_unary(e : Expr, op : str):
 
-  if is_bool(e.expr):
+  if has_bool(e.expr):
     return boolType
 
   raise Exception(f"invalid operands to '{op}'")
@@ -89,48 +112,79 @@ def check_logical_unary(e : Expr, op : str):
 def check_logical_binary(e : Expr, op : str):
 
   
-  if is_bool(e.lhs) and is_bool(e.rhs):
+  if has_bool(e.lhs) and has_bool(e.rhs):
     return boolType
   
   raise Exception(f"invalid operands to '{op}'")
 
+@checker.register(AndExpr)
 @checked
 def check_and(e : Expr):
   return check_logical_binary(e, "and")
 
+@checker.register(OrExpr)
 @checked
 def check_or(e : Expr):
   return check_logical_binary(e, "or")
 
+@checker.register(NotExpr)
+@checked
+def check_not(e : Expr):
+  return check_logical_unary(e, "not")
+
+@checker.register(IfExpr)
+@checked
+def check_if(e : Expr):
+  if not has_bool(e.cond):
+    raise Exception("condition is not a boolean")
+
+  if not has_same_type(e.true, e.false):
+    raise Exception("branch type mismatch")
+
+  return check(e.true)
+
 @checked
 def check_arithmetic_binary(e : Expr, op : str):
 
   
-  if is_int(e.lhs) and is_int(e.rhs):
+  if has_int(e.lhs) and has_int(e.rhs):
     return intType
   
   raise Exception(f"invalid operands to '{op}'")
 
+@checker.register(AddExpr)
 @checked
 def check_add(e : Expr):
   return check_arithmetic_binary(e, "+")
 
+@checker.register(SubExpr)
 @checked
 def check_sub(e : Expr):
   return check_arithmetic_binary(e, "-")
 
+@checker.register(MulExpr)
 @checked
 def check_mul(e : Expr):
   return check_arithmetic_binary(e, "*")
 
+@checker.register(DivExpr)
 @checked
 def check_div(e : Expr):
   return check_arithmetic_binary(e, "/")
 
+@checker.register(RemExpr)
 @checked
 def check_rem(e : Expr):
   return check_arithmetic_binary(e, "%")
 
+@checker.register(NegExpr)
+@checked
+def check_neg(e : Expr):
+  if has_int(e.expr):
+    return intType
+
+  raise Exception("invalid operand to '-'")
+
 @checked
 def check_relational(e : Expr, op : str):
  
@@ -140,42 +194,51 @@ def check_relational(e : Expr, op : str):
   
   raise Exception(f"invalid operands to '{op}'")  
 
+@checker.register(EqExpr)
 @checked
 def check_eq(e : Expr):
   return check_relational(e, "==")
 
+@checker.register(NeExpr)
 @checked
 def check_ne(e : Expr):
   return check_relational(e, "!=")
 
+@checker.register(LtExpr)
 @checked
 def check_lt(e : Expr):
   return check_relational(e, "<")
 
+@checker.register(GtExpr)
 @checked
 def check_gt(e : Expr):
   return check_relational(e, ">")
 
+@checker.register(LeExpr)
 @checked
 def check_le(e : Expr):
   return check_relational(e, "<=")
 
+@checker.register(GeExpr)
 @checked
 def check_ge(e : Expr):
   return check_relational(e, ">=")
 
+@checker.register(IdExpr)
 @checked
 def check_id(e : Expr):
 
   return e.ref.type
 
+@checker.register(LambdaExpr)
 @checked
 def check_lambda(e : Expr):
  
-  parms = [check(p) for p in e.vars]
+  parms = [p.type for p in e.vars]
   ret =  check(e.expr)
   return FnType(parms, ret)
 
+@checker.register(CallExpr)
 @checked
 def check_call(e : Expr):
   t = check(e.fn)
@@ -195,12 +258,14 @@ def check_call(e : Expr):
 
   return t.ret
 
+@checker.register(NewExpr)
 @checked
 def check_new(e : Expr):
  
   t = check(e.expr)
   return RefType(t)
 
+@checker.register(DerefExpr)
 @checked
 def check_deref(e : Expr):
 
@@ -210,6 +275,7 @@ def check_deref(e : Expr):
 
   return t.ref
 
+@checker.register(AssignExpr)
 @checked
 def check_assign(e : Expr):
   t1 = check(e.lhs)
@@ -220,6 +286,7 @@ def check_assign(e : Expr):
   if not is_reference_to(t1, t2):
     raise Exception("type mismatch in assignment")
 
+@checker.register(TupleExpr)
 @checked
 def check_tuple(e : Expr):
   ts = []
@@ -227,6 +294,7 @@ def check_tuple(e : Expr):
     ts += [check(x)]
   return TupleType(ts)
 
+@checker.register(ProjExpr)
 @checked
 def check_proj(e : Expr):
   t1 = check(e.obj)
@@ -239,6 +307,7 @@ def check_proj(e : Expr):
   t1.elems[e.index]
   return t1.elems[e.index]
 
+@checker.register(RecordExpr)
 @checked
 def check_record(e : Expr):
   fs = []
@@ -246,6 +315,7 @@ def check_record(e : Expr):
     fs += [FieldDecl(f.id, check(f.value))]
   return RecordType(fs)
 
+@checker.register(MemberExpr)
 @checked
 def check_member(e : Expr):
   t1 = check(e.obj)
@@ -259,6 +329,7 @@ def check_member(e : Expr):
 
   return e.ref.type
 
+@checker.register(VariantExpr)
 @checked
 def check_variant(e : Expr):
   t1 = check(e.field.value)
@@ -273,6 +344,7 @@ def check_variant(e : Expr):
 
   return e.variant
 
+@checker.register(CaseExpr)
 @checked
 def check_case(e : Expr):
   t1 = check(e.expr)
@@ -297,110 +369,11 @@ def check_case(e : Expr):
 
   return t2
 
+check_table = checker.table
+
 @checked
 def do_check(e : Expr):
- 
-  if type(e) is BoolExpr:
-    return check_bool(e)
-
-  if type(e) is AndExpr:
-    return check_logical_binary(e, "and")
-
-  if type(e) is OrExpr:
-    return check_logical_binary(e, "or")
-
-  if type(e) is NotExpr:
-    return check_logical_unary(e, "not")
-
-  if type(e) is IfExpr:
-    return check_if(e)
-
-  # Arithmetic expressions
-
-  if type(e) is IntExpr:
-    return check_int(e)
-
-  if type(e) is AddExpr:
-    return check_add(e)
-
-  if type(e) is SubExpr:
-    return check_sub(e)
-
-  if type(e) is MulExpr:
-    return check_mul(e)
-
-  if type(e) is DivExpr:
-    return check_div(e)
-
-  if type(e) is RemExpr:
-    return check_rem(e)
-
-  if type(e) is NegExpr:
-    return check_neg(e)
-
-  # Relational expressions
-
-  if type(e) is EqExpr:
-    return check_eq(e)
-
-  if type(e) is NeExpr:
-    return check_ne(e)
-
-  if type(e) is LtExpr:
-    return check_lt(e)
-
-  if type(e) is GtExpr:
-    return check_gt(e)
-
-  if type(e) is LeExpr:
-    return check_le(e)
-
-  if type(e) is GeExpr:
-    return check_ge(e)
-
-  if type(e) is IdExpr:
-    return check_id(e)
-
-  # Functional expressions
-
-  if type(e) is LambdaExpr:
-    return check_lambda(e)
-
-  if type(e) is CallExpr:
-    return check_call(e)
-
-  # Reference expressions
-
-  if type(e) is NewExpr:
-    return check_new(e)
-
-  if type(e) is DerefExpr:
-    return check_deref(e)
-
-  if type(e) is AssignExpr:
-    return check_assign(e)
-
-  # Data expressions
-
-  if type(e) is TupleExpr:
-    return check_tuple(e)
-
-  if type(e) is ProjExpr:
-    return check_proj(e)
-
-  if type(e) is RecordExpr:
-    return check_record(e)
-
-  if type(e) is MemberExpr:
-    return check_member(e)
-
-  if type(e) is VariantExpr:
-    return check_variant(e)
-
-  if type(e) is CaseExpr:
-    return check_case(e)
-
-  assert False
+  return check_table[type(e)](e)
 
 @checked
 def check(e : Expr):
@@ -0,0 +1,61 @@
+import inspect
+import os
+
+# Argument checking for @checked functions.
+#
+# In debug mode, the default, @checked wraps a function so that every call
+# checks each argument against its parameter's annotation, raising a
+# TypeError on a mismatch. The annotations are read once, when the function
+# is decorated; a call only runs the isinstance tests.
+#
+# In production mode @checked returns the function itself, so checked code
+# costs nothing at all. The mode is fixed when a function is decorated, so
+# choose it before importing the language, either in the environment:
+#
+#   LANG_PRODUCTION=1 python test.py
+#
+# or from code that runs first:
+#
+#   import checking
+#   checking.production = True
+#   from lang import *
+
+production = os.environ.get("LANG_PRODUCTION", "") not in ("", "0")
+
+
+def validators(fn):
+  # (position, name, class) for each parameter with a class annotation.
+  # Annotations that are not classes, and `object`, accept anything.
+  out = []
+  for i, p in enumerate(inspect.signature(fn).parameters.values()):
+    t = p.annotation
+    if isinstance(t, type) and t is not object:
+      out += [(i, p.name, t)]
+  return out
+
+def checked(fn):
+  if production:
+    return fn
+
+  checks = validators(fn)
+  if not checks:
+    return fn
+  name = fn.__qualname__
+
+  def check_args(*args, **kwargs):
+    for i, p, t in checks:
+      if i < len(args):
+        v = args[i]
+      elif p in kwargs:
+        v = kwargs[p]
+      else:
+        continue
+      if not isinstance(v, t):
+        raise TypeError(f"{name}: {p} must be {t.__name__}, not {type(v).__name__}")
+    return fn(*args, **kwargs)
+
+  check_args.__name__ = fn.__name__
+  check_args.__qualname__ = name
+  check_args.__doc__ = fn.__doc__
+  check_args.__wrapped__ = fn
+  return check_args
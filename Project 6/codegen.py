@@ -0,0 +1,459 @@
+from lang import *
+from dispatch import Dispatch
+from evaluate import Closure, Location, Tuple, Field, Record, Variant, evaluate
+from env import Env
+from heap import tracer
+from machine import Machine
+
+import hashlib
+import importlib.util
+import marshal
+import os
+import re
+import shutil
+import sys
+
+# Python code generation.
+#
+# lower(e) turns a resolved, checked expression into the source of a Python
+# function
+#
+#   def program(stack, heap, _lambdas, _free):
+#     ...
+#
+# in which every VarDecl is a Python local (lambda parameters become
+# parameters of a Python lambda), so variable access is a LOAD_FAST rather
+# than a dict lookup. codegen(e) compiles that source and returns
+# run(stack, heap), which computes the same value as evaluate(e, stack, heap).
+#
+# Compiling Python source is the expensive part, so the code objects are
+# cached on disk. The generated source names declarations by position and
+# never by identity, so it is a canonical rendering of the program's
+# structure and its hash is the cache key.
+
+generator = Dispatch("codegen")
+
+
+class CodeClosure(Closure):
+  # A function value backed by a generated Python function. Its env is
+  # empty: the values it captured are in the cells of fn, so only
+  # generated code can apply it.
+  __slots__ = ("fn",)
+
+  def __init__(self, abs, fn):
+    self.abs = abs
+    self.env = Env()
+    self.fn = fn
+
+@tracer.register(CodeClosure)
+def trace_code_closure(c):
+  out = []
+  for cell in c.fn.__closure__ or ():
+    try:
+      out += [cell.cell_contents]
+    except ValueError:
+      # Not assigned yet.
+      pass
+  return out
+
+
+class Lowering:
+  # Per-program state: names for declarations, the LambdaExpr and free
+  # VarDecl tables the generated code indexes into, and fresh temporaries.
+
+  def __init__(self):
+    self.names = {}
+    self.lambdas = []
+    self.free = []
+    self.temps = 0
+
+  def name(self, var):
+    if var not in self.names:
+      self.names[var] = f"v{len(self.names)}"
+    return self.names[var]
+
+  def temp(self):
+    self.temps += 1
+    return f"_t{self.temps}"
+
+
+def lower_binary(e, g, op):
+  return f"({lower_expr(e.lhs, g)} {op} {lower_expr(e.rhs, g)})"
+
+@generator.register(BoolExpr, IntExpr)
+def lower_literal(e, g):
+  return repr(e.value)
+
+# Both operands are evaluated, as in eval_and and eval_or, so these map to
+# the non-short-circuiting operators on bools.
+
+@generator.register(AndExpr)
+def lower_and(e, g):
+  return lower_binary(e, g, "&")
+
+@generator.register(OrExpr)
+def lower_or(e, g):
+  return lower_binary(e, g, "|")
+
+@generator.register(NotExpr)
+def lower_not(e, g):
+  return f"(not {lower_expr(e.expr, g)})"
+
+@generator.register(IfExpr)
+def lower_if(e, g):
+  c = lower_expr(e.cond, g)
+  t = lower_expr(e.true, g)
+  f = lower_expr(e.false, g)
+  return f"({t} if {c} else {f})"
+
+# Arithmetic expressions
+
+@generator.register(AddExpr)
+def lower_add(e, g):
+  return lower_binary(e, g, "+")
+
+@generator.register(SubExpr)
+def lower_sub(e, g):
+  return lower_binary(e, g, "-")
+
+@generator.register(MulExpr)
+def lower_mul(e, g):
+  return lower_binary(e, g, "*")
+
+@generator.register(DivExpr)
+def lower_div(e, g):
+  return lower_binary(e, g, "/")
+
+@generator.register(RemExpr)
+def lower_rem(e, g):
+  return lower_binary(e, g, "%")
+
+@generator.register(NegExpr)
+def lower_neg(e, g):
+  return f"(-{lower_expr(e.expr, g)})"
+
+# Relational expressions
+
+@generator.register(EqExpr)
+def lower_eq(e, g):
+  return lower_binary(e, g, "==")
+
+@generator.register(NeExpr)
+def lower_ne(e, g):
+  return lower_binary(e, g, "!=")
+
+@generator.register(LtExpr)
+def lower_lt(e, g):
+  return lower_binary(e, g, "<")
+
+@generator.register(GtExpr)
+def lower_gt(e, g):
+  return lower_binary(e, g, ">")
+
+@generator.register(LeExpr)
+def lower_le(e, g):
+  return lower_binary(e, g, "<=")
+
+@generator.register(GeExpr)
+def lower_ge(e, g):
+  return lower_binary(e, g, ">=")
+
+# Functional expressions
+
+@generator.register(IdExpr)
+def lower_id(e, g):
+  if e.ref not in g.names:
+    # Bound outside the program: loaded from the stack on entry.
+    g.free += [e.ref]
+  return g.name(e.ref)
+
+@generator.register(LambdaExpr)
+def lower_lambda(e, g):
+  i = len(g.lambdas)
+  g.lambdas += [e]
+  parms = ", ".join(g.name(v) for v in e.vars)
+  body = lower_expr(e.expr, g)
+  return f"_CodeClosure(_lambdas[{i}], (lambda {parms}: {body}))"
+
+@generator.register(CallExpr)
+def lower_call(e, g):
+  f = g.temp()
+  fn = lower_expr(e.fn, g)
+  args = ", ".join(lower_expr(a, g) for a in e.args)
+  return f"({f}.fn if type({f} := {fn}) is _CodeClosure else _callee({f}, heap))({args})"
+
+# Reference expressions
+
+@generator.register(NewExpr)
+def lower_new(e, g):
+  return f"heap.alloc({lower_expr(e.expr, g)})"
+
+@generator.register(DerefExpr)
+def lower_deref(e, g):
+  return f"heap.cells[_ref({lower_expr(e.expr, g)}).index]"
+
+@generator.register(AssignExpr)
+def lower_assign(e, g):
+  # The right-hand side is evaluated first, as in eval_assign.
+  v = lower_expr(e.rhs, g)
+  l = lower_expr(e.lhs, g)
+  return f"_assign(heap, {v}, {l})"
+
+# Data expressions
+
+@generator.register(TupleExpr)
+def lower_tuple(e, g):
+  es = ", ".join(lower_expr(x, g) for x in e.elems)
+  return f"_Tuple([{es}])"
+
+@generator.register(ProjExpr)
+def lower_proj(e, g):
+  return f"{lower_expr(e.obj, g)}.values[{e.index}]"
+
+@generator.register(RecordExpr)
+def lower_record(e, g):
+  fs = ", ".join(f"_Field({f.id!r}, {lower_expr(f.value, g)})" for f in e.fields)
+  return f"_Record([{fs}])"
+
+@generator.register(MemberExpr)
+def lower_member(e, g):
+  return f"{lower_expr(e.obj, g)}.select[{e.id!r}]"
+
+@generator.register(VariantExpr)
+def lower_variant(e, g):
+  return f"_Variant({e.field.id!r}, {lower_expr(e.field.value, g)})"
+
+@generator.register(CaseExpr)
+def lower_case(e, g):
+  t = g.temp()
+  v = lower_expr(e.expr, g)
+  out = "_no_case()"
+  for c in reversed(e.cases):
+    x = g.name(c.var)
+    body = lower_expr(c.expr, g)
+    out = f"(({x} := {t}.value, {body})[1] if {t}.tag == {c.id!r} else {out})"
+  return f"({t} := {v}, {out})[1]"
+
+lower_table = generator.table
+
+def lower_expr(e, g):
+  return lower_table[type(e)](e, g)
+
+def lower(e : Expr, g = None):
+  # Returns the source of `program` for e.
+  g = g or Lowering()
+  body = lower_expr(e, g)
+  lines = ["def program(stack, heap, _lambdas, _free):"]
+  for i, var in enumerate(g.free):
+    lines += [f"  {g.names[var]} = stack[_free[{i}]]"]
+  lines += [f"  return {body}"]
+  return "\n".join(lines) + "\n"
+
+
+# Runtime support for the generated code.
+
+def _callee(c, heap):
+  # Closures made by evaluate() are run by evaluate().
+  if not isinstance(c, Closure):
+    raise Exception("cannot apply a non-closure to an argument")
+  def call(*args):
+    return evaluate(c.abs.expr, c.env.bind(c.abs.vars, args), Machine(heap = heap))
+  return call
+
+def _ref(l):
+  if type(l) is not Location:
+    raise Exception("invalid reference")
+  return l
+
+def _assign(heap, v, l):
+  heap.cells[_ref(l).index] = v
+
+def _no_case():
+  assert False
+
+runtime = {
+  "_CodeClosure": CodeClosure,
+  "_Tuple": Tuple,
+  "_Field": Field,
+  "_Record": Record,
+  "_Variant": Variant,
+  "_callee": _callee,
+  "_ref": _ref,
+  "_assign": _assign,
+  "_no_case": _no_case,
+}
+
+
+def version():
+  # Cached code is only valid for the language and lowering that produced
+  # it, and for the interpreter that compiled it.
+  h = hashlib.sha256(importlib.util.MAGIC_NUMBER)
+  for m in ("lang", __name__):
+    path = getattr(sys.modules.get(m), "__file__", None)
+    if path:
+      with open(path, "rb") as f:
+        h.update(f.read())
+  return h.hexdigest()[:16]
+
+
+# Marks a version directory as made by CodeCache.
+marker = "lang-code-cache"
+
+def default_root():
+  # Per user, since the cached code is trusted and run.
+  base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+  return os.path.join(base, "lang-code-cache")
+
+def owned(st):
+  # Belongs to this user, and no one else can write to it.
+  if not hasattr(os, "getuid"):
+    return True
+  return st.st_uid == os.getuid() and not st.st_mode & 0o022
+
+
+class CodeCache:
+  # Code objects marshalled to <root>/<version>/<key>.code. Directories
+  # that a CodeCache made for other versions are removed on first use.
+  # Entries are evicted least recently used first (by mtime, refreshed on
+  # every hit) once the cache holds more than max_entries files or
+  # max_bytes bytes.
+  #
+  # The default root is in the user's cache directory, and the cache makes
+  # its directories private. An entry is only loaded if it, its directory
+  # and the root belong to this user and only this user can write to them;
+  # anything else counts as a miss.
+
+  def __init__(self, root = None, max_entries = 1024, max_bytes = 64 << 20):
+    self.root = root or os.environ.get("LANG_CODE_CACHE") or default_root()
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.version = version()
+    self.dir = os.path.join(self.root, self.version)
+    self.memory = {}
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.invalidate()
+
+  def invalidate(self):
+    # root may be shared with other data, so only directories this class
+    # made, named by a version and holding the marker, are removed.
+    self.make_dir()
+    for d in os.listdir(self.root):
+      path = os.path.join(self.root, d)
+      if d != self.version and re.fullmatch("[0-9a-f]{16}", d) \
+          and os.path.isfile(os.path.join(path, marker)):
+        shutil.rmtree(path, ignore_errors = True)
+
+  def make_dir(self):
+    os.makedirs(self.root, mode = 0o700, exist_ok = True)
+    os.makedirs(self.dir, mode = 0o700, exist_ok = True)
+    open(os.path.join(self.dir, marker), "a").close()
+
+  def trusted(self):
+    try:
+      return owned(os.stat(self.root)) and owned(os.stat(self.dir))
+    except OSError:
+      return False
+
+  def clear(self):
+    shutil.rmtree(self.dir, ignore_errors = True)
+    self.make_dir()
+    self.memory.clear()
+
+  def get(self, key):
+    code = self.memory.get(key)
+    if code is not None:
+      self.hits += 1
+      return code
+
+    # Loaded code is run, so it is only read from where nobody else could
+    # have written it.
+    path = os.path.join(self.dir, key + ".code")
+    code = None
+    try:
+      if self.trusted():
+        with open(path, "rb") as f:
+          if owned(os.fstat(f.fileno())):
+            code = marshal.load(f)
+      if code is not None:
+        os.utime(path)
+    except (OSError, EOFError, ValueError, TypeError):
+      code = None
+    if code is None:
+      self.misses += 1
+      return None
+
+    self.hits += 1
+    self.memory[key] = code
+    return code
+
+  def put(self, key, code):
+    self.memory[key] = code
+    path = os.path.join(self.dir, key + ".code")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+      marshal.dump(code, f)
+    os.replace(tmp, path)
+    self.evict()
+
+  def evict(self):
+    entries = []
+    for f in os.listdir(self.dir):
+      if not f.endswith(".code"):
+        continue
+      try:
+        st = os.stat(os.path.join(self.dir, f))
+      except OSError:
+        continue
+      entries += [(st.st_mtime, st.st_size, f)]
+
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+      _, size, f = entries.pop(0)
+      try:
+        os.remove(os.path.join(self.dir, f))
+      except OSError:
+        pass
+      self.memory.pop(f[:-len(".code")], None)
+      total -= size
+      self.evictions += 1
+
+  def __str__(self):
+    return f"{self.dir}: {self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+
+
+default_cache = None
+
+def codegen(e : Expr, cache = None):
+  # Returns run(stack, heap) for e, compiling the generated source only on
+  # a cache miss. Pass cache = False to bypass the cache entirely.
+  global default_cache
+  if cache is None:
+    if default_cache is None:
+      default_cache = CodeCache()
+    cache = default_cache
+
+  g = Lowering()
+  src = lower(e, g)
+  key = hashlib.sha256(src.encode()).hexdigest()
+
+  code = cache.get(key) if cache else None
+  if code is None:
+    code = compile(src, f"<lang {key[:12]}>", "exec")
+    if cache:
+      cache.put(key, code)
+
+  ns = dict(runtime)
+  exec(code, ns)
+  program = ns["program"]
+  lambdas = g.lambdas
+  free = g.free
+
+  # As in compiler.py, values live in Python locals while the code runs,
+  # so the heap does not collect until it returns.
+  def run(stack, heap):
+    with heap.uncollected():
+      return program(stack, heap, lambdas, free)
+  return run
@@ -0,0 +1,191 @@
+from lang import *
+from dispatch import Dispatch
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+# Columnar evaluation.
+#
+# evaluate_batch(fn, columns) applies a resolved lambda over Int and Bool
+# parameters to many rows at once. Each parameter gets a NumPy array with
+# one entry per row, and every node of the body is evaluated once over
+# whole columns rather than once per row:
+#
+#   fn = resolve(LambdaExpr([VarDecl("x", int), VarDecl("y", int)],
+#                           IfExpr(LtExpr("x", "y"), "x", "y")))
+#   evaluate_batch(fn, [np.array([1, 5]), np.array([3, 2])])  # [1, 2]
+#
+# Entry i of the result is evaluate(fn)(row i), with the same operators:
+# `/` is true division, `%` takes the sign of the divisor, and both operands
+# of `and` and `or` are evaluated. An if computes both branches over the
+# whole column and picks with np.where, but a division by zero only raises
+# when it happens in a row whose branch is taken, as it would row by row.
+# Ints are int64 while they fit. An addition, subtraction, multiplication
+# or negation that would overflow in some row is done again on Python ints
+# (dtype object), which do not overflow, so those columns are slower but
+# still exact.
+#
+# Handlers take the node, the columns by VarDecl, and the mask of rows
+# whose value is actually used (None for every row). Subexpressions that
+# do not mention a parameter stay Python scalars and broadcast.
+
+batcher = Dispatch("batch")
+
+
+def active_zero(v, active):
+  zero = np.asarray(v == 0)
+  if active is not None:
+    zero = zero & active
+  return bool(zero.any())
+
+def safe_divisor(v):
+  # Rows whose divisor is zero are not used; divide them by one instead.
+  return np.where(v == 0, 1, v)
+
+@batcher.register(BoolExpr, IntExpr)
+def batch_literal(e, cols, active):
+  return e.value
+
+@batcher.register(IdExpr)
+def batch_id(e, cols, active):
+  if e.ref not in cols:
+    raise Exception(f"batch: {e.id} is not a parameter")
+  return cols[e.ref]
+
+# Overflow checks on int64.
+
+INT_MIN = -1 << 63
+INT_MAX = (1 << 63) - 1
+
+def is_fixed(v):
+  return isinstance(v, np.ndarray) and v.dtype == np.int64
+
+def fits(v):
+  return type(v) is not int or INT_MIN <= v <= INT_MAX
+
+def exact(v):
+  return v.astype(object) if isinstance(v, np.ndarray) else v
+
+def add_overflows(v1, v2, r):
+  # The result has the wrong sign for operands of the same sign.
+  return (v1 ^ r) & (v2 ^ r) < 0
+
+def sub_overflows(v1, v2, r):
+  return (v1 ^ v2) & (v1 ^ r) < 0
+
+def mul_overflows(v1, v2, r):
+  # Dividing back does not give the other operand, except for -1 * INT_MIN,
+  # which wraps to a product that does divide back.
+  nonzero = np.not_equal(v1, 0)
+  q = np.floor_divide(r, np.where(nonzero, v1, 1))
+  return nonzero & ((q != v2) | (np.equal(v1, -1) & np.equal(v2, INT_MIN)))
+
+def checked(op, overflows):
+  def run(v1, v2):
+    if not (is_fixed(v1) or is_fixed(v2)):
+      # Python ints, or columns that are already exact.
+      return op(v1, v2)
+    if fits(v1) and fits(v2):
+      with np.errstate(over = "ignore", divide = "ignore"):
+        r = op(v1, v2)
+        if not np.any(overflows(v1, v2, r)):
+          return r
+    return op(exact(v1), exact(v2))
+  return run
+
+binary = {
+  AndExpr: lambda v1, v2: v1 & v2,
+  OrExpr: lambda v1, v2: v1 | v2,
+  AddExpr: checked(lambda v1, v2: v1 + v2, add_overflows),
+  SubExpr: checked(lambda v1, v2: v1 - v2, sub_overflows),
+  MulExpr: checked(lambda v1, v2: v1 * v2, mul_overflows),
+  EqExpr: lambda v1, v2: v1 == v2,
+  NeExpr: lambda v1, v2: v1 != v2,
+  LtExpr: lambda v1, v2: v1 < v2,
+  GtExpr: lambda v1, v2: v1 > v2,
+  LeExpr: lambda v1, v2: v1 <= v2,
+  GeExpr: lambda v1, v2: v1 >= v2,
+}
+
+@batcher.register(*binary)
+def batch_binary(e, cols, active):
+  v1 = batch(e.lhs, cols, active)
+  v2 = batch(e.rhs, cols, active)
+  return binary[type(e)](v1, v2)
+
+@batcher.register(DivExpr)
+def batch_div(e, cols, active):
+  v1 = batch(e.lhs, cols, active)
+  v2 = batch(e.rhs, cols, active)
+  if active_zero(v2, active):
+    raise ZeroDivisionError("division by zero")
+  return np.true_divide(v1, safe_divisor(v2))
+
+@batcher.register(RemExpr)
+def batch_rem(e, cols, active):
+  v1 = batch(e.lhs, cols, active)
+  v2 = batch(e.rhs, cols, active)
+  if active_zero(v2, active):
+    raise ZeroDivisionError("integer modulo by zero")
+  return np.remainder(v1, safe_divisor(v2))
+
+@batcher.register(NotExpr)
+def batch_not(e, cols, active):
+  return np.logical_not(batch(e.expr, cols, active))
+
+@batcher.register(NegExpr)
+def batch_neg(e, cols, active):
+  v = batch(e.expr, cols, active)
+  if is_fixed(v) and np.any(v == INT_MIN):
+    v = exact(v)
+  return np.negative(v)
+
+@batcher.register(IfExpr)
+def batch_if(e, cols, active):
+  c = batch(e.cond, cols, active)
+  if np.ndim(c) == 0:
+    # The same branch for every row.
+    return batch(e.true if c else e.false, cols, active)
+
+  t = batch(e.true, cols, c if active is None else active & c)
+  f = batch(e.false, cols, ~c if active is None else active & ~c)
+  return np.where(c, t, f)
+
+batch_table = batcher.table
+
+def batch(e : Expr, cols, active):
+  return batch_table[type(e)](e, cols, active)
+
+
+def column(c):
+  # Integer columns are int64, or exact if they do not fit.
+  c = np.asarray(c)
+  if c.dtype.kind in "iu" and c.dtype != np.int64:
+    c = c.astype(np.int64 if np.can_cast(c.dtype, np.int64) else object)
+  return c
+
+def evaluate_batch(fn : Expr, columns):
+  # columns holds one array per parameter, as a list in parameter order or
+  # a dict by parameter name. Returns one array with a value per row.
+  if np is None:
+    raise Exception("evaluate_batch requires numpy")
+  if type(fn) is not LambdaExpr:
+    raise Exception("evaluate_batch: not a lambda")
+
+  if isinstance(columns, dict):
+    columns = [columns[var.id] for var in fn.vars]
+  if len(columns) != len(fn.vars):
+    raise Exception("evaluate_batch: wrong number of columns")
+
+  cols = {var: column(c) for var, c in zip(fn.vars, columns)}
+  rows = {len(c) for c in cols.values()}
+  if len(rows) > 1:
+    raise Exception("evaluate_batch: columns differ in length")
+  n = rows.pop() if rows else 1
+
+  v = np.asarray(batch(fn.expr, cols, None))
+  if v.ndim == 0:
+    v = np.full(n, v)
+  return v
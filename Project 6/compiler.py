@@ -0,0 +1,258 @@
+from lang import *
+from dispatch import Dispatch
+from evaluate import Closure, Location, Tuple, Field, Record, Variant, evaluate
+from evaluate import trace_closure
+from heap import tracer
+from machine import Machine
+
+# Closure compilation.
+#
+# compile(e) walks a resolved, checked expression once and returns a Python
+# function run(stack, heap) that computes the same value as
+# evaluate(e, stack, heap). Every node becomes a specialised closure over
+# the closures of its children, so running the result again does no
+# dispatch and reads no attributes of AST nodes.
+
+compiler = Dispatch("compile")
+
+
+class CompiledClosure(Closure):
+  # A function value whose body has already been compiled. vars is
+  # abs.vars, kept here so that calls do not go through the AST.
+  __slots__ = ("code", "vars")
+
+  def __init__(self, abs, env, code, vars):
+    self.abs = abs
+    self.env = env
+    self.code = code
+    self.vars = vars
+
+tracer.register(CompiledClosure)(trace_closure)
+
+
+@compiler.register(BoolExpr, IntExpr)
+def compile_literal(e):
+  v = e.value
+  return lambda stack, heap: v
+
+@compiler.register(AndExpr)
+def compile_and(e):
+  l = compile_expr(e.lhs)
+  r = compile_expr(e.rhs)
+  def run(stack, heap):
+    v1 = l(stack, heap)
+    v2 = r(stack, heap)
+    return v1 and v2
+  return run
+
+@compiler.register(OrExpr)
+def compile_or(e):
+  l = compile_expr(e.lhs)
+  r = compile_expr(e.rhs)
+  def run(stack, heap):
+    v1 = l(stack, heap)
+    v2 = r(stack, heap)
+    return v1 or v2
+  return run
+
+@compiler.register(NotExpr)
+def compile_not(e):
+  x = compile_expr(e.expr)
+  return lambda stack, heap: not x(stack, heap)
+
+@compiler.register(IfExpr)
+def compile_if(e):
+  c = compile_expr(e.cond)
+  t = compile_expr(e.true)
+  f = compile_expr(e.false)
+  return lambda stack, heap: t(stack, heap) if c(stack, heap) else f(stack, heap)
+
+# Arithmetic expressions
+
+@compiler.register(AddExpr)
+def compile_add(e):
+  l = compile_expr(e.lhs)
+  r = compile_expr(e.rhs)
+  return lambda stack, heap: l(stack, heap) + r(stack, heap)
+
+@compiler.register(SubExpr)
+def compile_sub(e):
+  l = compile_expr(e.lhs)
+  r = compile_expr(e.rhs)
+  return lambda stack, heap: l(stack, heap) - r(stack, heap)
+
+@compiler.register(MulExpr)
+def compile_mul(e):
+  l = compile_expr(e.lhs)
+  r = compile_expr(e.rhs)
+  return lambda stack, heap: l(stack, heap) * r(stack, heap)
+
+@compiler.register(DivExpr)
+def compile_div(e):
+  l = compile_expr(e.lhs)
+  r = compile_expr(e.rhs)
+  return lambda stack, heap: l(stack, heap) / r(stack, heap)
+
+@compiler.register(RemExpr)
+def compile_rem(e):
+  l = compile_expr(e.lhs)
+  r = compile_expr(e.rhs)
+  return lambda stack, heap: l(stack, heap) % r(stack, heap)
+
+@compiler.register(NegExpr)
+def compile_neg(e):
+  x = compile_expr(e.expr)
+  return lambda stack, heap: -x(stack, heap)
+
+# Relational expressions
+
+@compiler.register(EqExpr)
+def compile_eq(e):
+  l = compile_expr(e.lhs)
+  r = compile_expr(e.rhs)
+  return lambda stack, heap: l(stack, heap) == r(stack, heap)
+
+@compiler.register(NeExpr)
+def compile_ne(e):
+  l = compile_expr(e.lhs)
+  r = compile_expr(e.rhs)
+  return lambda stack, heap: l(stack, heap) != r(stack, heap)
+
+@compiler.register(LtExpr)
+def compile_lt(e):
+  l = compile_expr(e.lhs)
+  r = compile_expr(e.rhs)
+  return lambda stack, heap: l(stack, heap) < r(stack, heap)
+
+@compiler.register(GtExpr)
+def compile_gt(e):
+  l = compile_expr(e.lhs)
+  r = compile_expr(e.rhs)
+  return lambda stack, heap: l(stack, heap) > r(stack, heap)
+
+@compiler.register(LeExpr)
+def compile_le(e):
+  l = compile_expr(e.lhs)
+  r = compile_expr(e.rhs)
+  return lambda stack, heap: l(stack, heap) <= r(stack, heap)
+
+@compiler.register(GeExpr)
+def compile_ge(e):
+  l = compile_expr(e.lhs)
+  r = compile_expr(e.rhs)
+  return lambda stack, heap: l(stack, heap) >= r(stack, heap)
+
+# Functional expressions
+
+@compiler.register(IdExpr)
+def compile_id(e):
+  ref = e.ref
+  return lambda stack, heap: stack[ref]
+
+@compiler.register(LambdaExpr)
+def compile_lambda(e):
+  body = compile_expr(e.expr)
+  vars = tuple(e.vars)
+  return lambda stack, heap: CompiledClosure(e, stack, body, vars)
+
+@compiler.register(CallExpr)
+def compile_call(e):
+  fn = compile_expr(e.fn)
+  args = [compile_expr(a) for a in e.args]
+
+  def run(stack, heap):
+    c = fn(stack, heap)
+    if type(c) is CompiledClosure:
+      return c.code(c.env.bind(c.vars, [a(stack, heap) for a in args]), heap)
+
+    # Other subclasses, such as codegen's, do not keep their captured
+    # values in env.
+    if type(c) is not Closure:
+      raise Exception("cannot apply a non-closure to an argument")
+    env = c.env.bind(c.abs.vars, [a(stack, heap) for a in args])
+    return evaluate(c.abs.expr, env, Machine(heap = heap))
+  return run
+
+# Reference expressions
+
+@compiler.register(NewExpr)
+def compile_new(e):
+  x = compile_expr(e.expr)
+  return lambda stack, heap: heap.alloc(x(stack, heap))
+
+@compiler.register(DerefExpr)
+def compile_deref(e):
+  x = compile_expr(e.expr)
+  def run(stack, heap):
+    l1 = x(stack, heap)
+    if type(l1) is not Location:
+      raise Exception("invalid reference")
+    return heap[l1.index]
+  return run
+
+@compiler.register(AssignExpr)
+def compile_assign(e):
+  l = compile_expr(e.lhs)
+  r = compile_expr(e.rhs)
+  def run(stack, heap):
+    v2 = r(stack, heap)
+    l1 = l(stack, heap)
+    if type(l1) is not Location:
+      raise Exception("invalid reference")
+    heap[l1.index] = v2
+  return run
+
+# Data expressions
+
+@compiler.register(TupleExpr)
+def compile_tuple(e):
+  xs = [compile_expr(x) for x in e.elems]
+  return lambda stack, heap: Tuple([x(stack, heap) for x in xs])
+
+@compiler.register(ProjExpr)
+def compile_proj(e):
+  x = compile_expr(e.obj)
+  n = e.index
+  return lambda stack, heap: x(stack, heap).values[n]
+
+@compiler.register(RecordExpr)
+def compile_record(e):
+  fs = [(f.id, compile_expr(f.value)) for f in e.fields]
+  return lambda stack, heap: Record([Field(id, x(stack, heap)) for id, x in fs])
+
+@compiler.register(MemberExpr)
+def compile_member(e):
+  x = compile_expr(e.obj)
+  id = e.id
+  return lambda stack, heap: x(stack, heap).select[id]
+
+@compiler.register(VariantExpr)
+def compile_variant(e):
+  tag = e.field.id
+  x = compile_expr(e.field.value)
+  return lambda stack, heap: Variant(tag, x(stack, heap))
+
+@compiler.register(CaseExpr)
+def compile_case(e):
+  x = compile_expr(e.expr)
+  arms = {c.id: (c.var, compile_expr(c.expr)) for c in reversed(e.cases)}
+
+  def run(stack, heap):
+    v1 = x(stack, heap)
+    var, body = arms[v1.tag]
+    return body(stack.extend({var: v1.value}), heap)
+  return run
+
+compile_table = compiler.table
+
+def compile_expr(e):
+  return compile_table[type(e)](e)
+
+def compile(e : Expr):
+  # The compiled code keeps values in Python locals, out of the collector's
+  # sight, so the heap does not collect while it runs.
+  run = compile_expr(e)
+  def run_uncollected(stack, heap):
+    with heap.uncollected():
+      return run(stack, heap)
+  return run_uncollected
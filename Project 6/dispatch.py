@@ -0,0 +1,52 @@
+# Shared dispatch for the passes over the AST.
+#
+# Each pass (evaluate, resolve, check, subst, step) owns a Dispatch that
+# maps a node class to the function handling it, so picking a handler is a
+# single dict lookup on type(e) no matter how many node kinds there are.
+# A new node kind registers its handlers once, next to their definitions:
+#
+#   @evaluator.register(AddExpr)
+#   def eval_add(e, stack, heap):
+#     ...
+
+# Every Dispatch by pass name, e.g. passes["evaluate"].table[AddExpr].
+passes = {}
+
+
+class Table(dict):
+  # The handler table of one pass. Unknown node kinds fail loudly with the
+  # name of the pass instead of a bare KeyError.
+
+  def __init__(self, name, base = ()):
+    dict.__init__(self, base)
+    self.name = name
+
+  def __missing__(self, kind):
+    raise Exception(f"{self.name}: no rule for {kind.__name__}")
+
+
+class Dispatch:
+
+  def __init__(self, name, base = None):
+    self.name = name
+    self.table = Table(name, base.table if base else ())
+    passes[name] = self
+
+  def register(self, *kinds):
+    def add(fn):
+      for k in kinds:
+        self.table[k] = fn
+      return fn
+    return add
+
+  def handles(self, kind):
+    return kind in self.table
+
+  def __str__(self):
+    kinds = ",".join(k.__name__ for k in self.table)
+    return f"{self.name}[{kinds}]"
+
+
+def handlers(kind):
+  # Every pass that knows how to handle the given node class.
+  return {name: d.table[kind] for name, d in passes.items() if kind in d.table}
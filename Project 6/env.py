@@ -0,0 +1,119 @@
+# Persistent environments.
+#
+# An Env is an immutable frame of bindings (VarDecl -> value) with a link to
+# the frame it extends. Frames are never modified once built, so capturing
+# an environment in a closure is just keeping a reference to it, and
+# extending one costs only the new bindings; the rest of the chain is shared.
+#
+# A Frame is the same chain with the bindings kept in a list indexed by
+# slot. resolve() gives every IdExpr the (depth, slot) address of its
+# declaration, so a variable is found by following `depth` parent links and
+# indexing the list, with no hashing. Passing a Frame as the stack selects
+# this representation for the whole evaluation:
+#
+#   evaluate(e, Frame(), Machine())
+
+
+class Env:
+  __slots__ = ("bindings", "parent")
+
+  def __init__(self, bindings = None, parent = None):
+    self.bindings = bindings or {}
+    self.parent = parent
+
+  def extend(self, bindings : dict):
+    # Takes ownership of bindings, which must not be modified afterwards.
+    return Env(bindings, self)
+
+  def bind(self, vars, values):
+    return Env(dict(zip(vars, values)), self)
+
+  def lookup(self, e):
+    # The value of the resolved IdExpr e.
+    var = e.ref
+    env = self
+    while env is not None:
+      b = env.bindings
+      if var in b:
+        return b[var]
+      env = env.parent
+    raise KeyError(var)
+
+  def __getitem__(self, var):
+    env = self
+    while env is not None:
+      b = env.bindings
+      if var in b:
+        return b[var]
+      env = env.parent
+    raise KeyError(var)
+
+  def __contains__(self, var):
+    try:
+      self[var]
+      return True
+    except KeyError:
+      return False
+
+  def items(self):
+    # Visible bindings, innermost first.
+    seen = set()
+    env = self
+    while env is not None:
+      for var, v in env.bindings.items():
+        if var not in seen:
+          seen.add(var)
+          yield var, v
+      env = env.parent
+
+  def depth(self):
+    n = 0
+    env = self.parent
+    while env is not None:
+      n += 1
+      env = env.parent
+    return n
+
+  def __str__(self):
+    bs = ",".join(f"{var.id}={v}" for var, v in self.items())
+    return f"[{bs}]"
+
+
+class Frame(Env):
+  __slots__ = ("vars", "values")
+
+  def __init__(self, vars = (), values = (), parent = None):
+    self.vars = vars
+    self.values = values
+    self.parent = parent
+
+  def extend(self, bindings : dict):
+    return Frame(list(bindings), list(bindings.values()), self)
+
+  def bind(self, vars, values):
+    # vars is kept by reference; it is only read to look up by VarDecl.
+    return Frame(vars, values, self)
+
+  def lookup(self, e):
+    env = self
+    for _ in range(e.depth):
+      env = env.parent
+    return env.values[e.slot]
+
+  def __getitem__(self, var):
+    env = self
+    while env is not None:
+      if var in env.vars:
+        return env.values[env.vars.index(var)]
+      env = env.parent
+    raise KeyError(var)
+
+  def items(self):
+    seen = set()
+    env = self
+    while env is not None:
+      for var, v in zip(env.vars, env.values):
+        if var not in seen:
+          seen.add(var)
+          yield var, v
+      env = env.parent
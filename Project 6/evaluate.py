@@ -1,27 +1,25 @@
 from lang import *
+from dispatch import Dispatch
+from env import Env
+from heap import Location, tracer
+from machine import Machine
 
-import copy
-
-clone = copy.deepcopy
+evaluator = Dispatch("evaluate")
 
 
 class Closure:
-  
+  __slots__ = ("abs", "env")
+
   def __init__(self, abs, env):
     self.abs = abs
-    self.env = clone(env)
+    self.env = env
 
   def __str__(self):
     return f"<{str(self.abs)}>"
 
-class Location:
-  def __init__(self, ix):
-    self.index = ix
-
-  def __str__(self):
-    return f"@{self.index}"
-
 class Tuple:
+  __slots__ = ("values",)
+
   def __init__(self, vs : list):
     self.values = vs
 
@@ -30,6 +28,8 @@ class Tuple:
     return f"{{{vs}}}"
 
 class Field:
+  __slots__ = ("id", "value")
+
   def __init__(self, n, v):
     self.id = n
     self.value = v
@@ -38,6 +38,8 @@ class Field:
     return f"{self.id}={self.value}"
 
 class Record:
+  __slots__ = ("fields", "select")
+
   def __init__(self, fs : list):
     self.fields = fs
 
@@ -48,7 +50,8 @@ class Record:
     return f"{{{fs}}}"
 
 class Variant:
-  
+  __slots__ = ("tag", "value")
+
   def __init__(self, l, v):
     self.tag = l
     self.value = v
@@ -56,152 +59,232 @@ class Variant:
   def __str__(self):
     return f"<{self.tag}={self.value}>"
 
+# What each runtime value refers to, for the collector.
+
+@tracer.register(Closure)
+def trace_closure(c):
+  return [c.env]
+
+@tracer.register(Tuple)
+def trace_tuple(t):
+  return t.values
+
+@tracer.register(Field, Variant)
+def trace_field(f):
+  return [f.value]
+
+@tracer.register(Record)
+def trace_record(r):
+  return r.fields
+
 @checked
-def eval_binary(e : Expr, stack : dict, heap : list, fn : object):
+def eval_binary(e : Expr, stack : Env, m : Machine, fn : object):
  
-  v1 = evaluate(e.lhs, stack, heap)
-  v2 = evaluate(e.rhs, stack, heap)
+  v1 = evaluate(e.lhs, stack, m)
+  m.heap.roots.append(v1)
+  v2 = evaluate(e.rhs, stack, m)
+  m.heap.roots.pop()
   return fn(v1, v2)
 
 @checked
-def eval_unary(e : Expr, stack : dict, heap : list, fn : object):
+def eval_unary(e : Expr, stack : Env, m : Machine, fn : object):
  
-  v1 = evaluate(e.lhs, stack, heap)
+  v1 = evaluate(e.expr, stack, m)
   return fn(v1)
 
+@evaluator.register(BoolExpr)
 @checked
-def eval_bool(e : Expr, stack : dict, heap : list):
+def eval_bool(e : Expr, stack : Env, m : Machine):
   
   return e.value
 
+@evaluator.register(AndExpr)
 @checked
-def eval_and(e : Expr, stack : dict, heap : list):
-  return eval_binary(e, stack, heap, lambda v1, v2: v1 and v2)
+def eval_and(e : Expr, stack : Env, m : Machine):
+  return eval_binary(e, stack, m, lambda v1, v2: v1 and v2)
 
+@evaluator.register(OrExpr)
 @checked
-def eval_or(e : Expr, stack : dict, heap : list):
-  return eval_binary(e, stack, heap, lambda v1, v2: v1 or v2)
+def eval_or(e : Expr, stack : Env, m : Machine):
+  return eval_binary(e, stack, m, lambda v1, v2: v1 or v2)
 
+@evaluator.register(NotExpr)
 @checked
-def eval_not(e : Expr, stack : dict, heap : list):
-  return eval_unary(e, stack, heap, lambda v1: not v1)
+def eval_not(e : Expr, stack : Env, m : Machine):
+  return eval_unary(e, stack, m, lambda v1: not v1)
 
-def eval_cond(e, stack, heap : list):
-  if evaluate(e.cond):
-    return evaluate(e.true);
+@evaluator.register(IfExpr)
+@checked
+def eval_if(e : Expr, stack : Env, m : Machine):
+  if evaluate(e.cond, stack, m):
+    return evaluate(e.true, stack, m)
   else:
-    return evaluate(e.false);
+    return evaluate(e.false, stack, m)
 
+@evaluator.register(IntExpr)
 @checked
-def eval_int(e : Expr, stack : dict, heap : list):
+def eval_int(e : Expr, stack : Env, m : Machine):
   return e.value
 
+@evaluator.register(AddExpr)
 @checked
-def eval_add(e : Expr, stack : dict, heap : list):
-  return eval_binary(e, stack, heap, lambda v1, v2: v1 + v2)
+def eval_add(e : Expr, stack : Env, m : Machine):
+  return eval_binary(e, stack, m, lambda v1, v2: v1 + v2)
 
+@evaluator.register(SubExpr)
 @checked
-def eval_sub(e : Expr, stack : dict, heap : list):
-  return eval_binary(e, stack, heap, lambda v1, v2: v1 - v2)
+def eval_sub(e : Expr, stack : Env, m : Machine):
+  return eval_binary(e, stack, m, lambda v1, v2: v1 - v2)
 
+@evaluator.register(MulExpr)
 @checked
-def eval_mul(e : Expr, stack : dict, heap : list):
-  return eval_binary(e, stack, heap, lambda v1, v2: v1 * v2)
+def eval_mul(e : Expr, stack : Env, m : Machine):
+  return eval_binary(e, stack, m, lambda v1, v2: v1 * v2)
 
+@evaluator.register(DivExpr)
 @checked
-def eval_div(e : Expr, stack : dict, heap : list):
-  return eval_binary(e, stack, heap, lambda v1, v2: v1 / v2)
+def eval_div(e : Expr, stack : Env, m : Machine):
+  return eval_binary(e, stack, m, lambda v1, v2: v1 / v2)
 
+@evaluator.register(RemExpr)
 @checked
-def eval_rem(e : Expr, stack : dict, heap : list):
-  return eval_binary(e, stack, heap, lambda v1, v2: v1 % v2)
+def eval_rem(e : Expr, stack : Env, m : Machine):
+  return eval_binary(e, stack, m, lambda v1, v2: v1 % v2)
 
+@evaluator.register(NegExpr)
 @checked
-def eval_neg(e : Expr, stack : dict, heap : list):
-  return eval_binary(e, stack, heap, lambda v1: -v1)
+def eval_neg(e : Expr, stack : Env, m : Machine):
+  return eval_unary(e, stack, m, lambda v1: -v1)
 
+@evaluator.register(EqExpr)
 @checked
-def eval_eq(e : Expr, stack : dict, heap : list):
-  return eval_binary(e, stack, heap, lambda v1, v2: v1 == v2)
+def eval_eq(e : Expr, stack : Env, m : Machine):
+  return eval_binary(e, stack, m, lambda v1, v2: v1 == v2)
 
+@evaluator.register(NeExpr)
 @checked
-def eval_ne(e : Expr, stack : dict, heap : list):
-  return eval_binary(e, stack, heap, lambda v1, v2: v1 != v2)
+def eval_ne(e : Expr, stack : Env, m : Machine):
+  return eval_binary(e, stack, m, lambda v1, v2: v1 != v2)
 
+@evaluator.register(LtExpr)
 @checked
-def eval_lt(e : Expr, stack : dict, heap : list):
-  return eval_binary(e, stack, heap, lambda v1, v2: v1 < v2)
+def eval_lt(e : Expr, stack : Env, m : Machine):
+  return eval_binary(e, stack, m, lambda v1, v2: v1 < v2)
 
+@evaluator.register(GtExpr)
 @checked
-def eval_gt(e : Expr, stack : dict, heap : list):
-  return eval_binary(e, stack, heap, lambda v1, v2: v1 > v2)
+def eval_gt(e : Expr, stack : Env, m : Machine):
+  return eval_binary(e, stack, m, lambda v1, v2: v1 > v2)
 
+@evaluator.register(LeExpr)
 @checked
-def eval_le(e : Expr, stack : dict, heap : list):
-  return eval_binary(e, stack, heap, lambda v1, v2: v1 <= v2)
+def eval_le(e : Expr, stack : Env, m : Machine):
+  return eval_binary(e, stack, m, lambda v1, v2: v1 <= v2)
 
+@evaluator.register(GeExpr)
 @checked
-def eval_ge(e : Expr, stack : dict, heap : list):
-  return eval_binary(e, stack, heap, lambda v1, v2: v1 >= v2)
+def eval_ge(e : Expr, stack : Env, m : Machine):
+  return eval_binary(e, stack, m, lambda v1, v2: v1 >= v2)
 
+@evaluator.register(IdExpr)
 @checked
-def eval_id(e : Expr, stack : dict, heap : list):
+def eval_id(e : Expr, stack : Env, m : Machine):
 
-  return stack[e.ref]
+  return stack.lookup(e)
 
+@evaluator.register(LambdaExpr)
 @checked
-def eval_lambda(e : Expr, stack : dict, heap : list):
+def eval_lambda(e : Expr, stack : Env, m : Machine):
  
   return Closure(e, stack)
 
-def eval_call(e : Expr, stack : dict, heap : list):
-  c = evaluate(e.fn, stack, heap)
+@evaluator.register(CallExpr)
+def eval_call(e : Expr, stack : Env, m : Machine):
+  c = evaluate(e.fn, stack, m)
   
   if type(c) is not Closure:
     raise Exception("cannot apply a non-closure to an argument")
 
+  roots = m.heap.roots
   args = []
+  roots += [c, args]
   for a in e.args:
-    args += [evaluate(a, stack, heap)]
-
-  env = clone(c.env)
-  for i in range(len(args)):
-    env[c.abs.vars[i]] = args[i]
+    args += [evaluate(a, stack, m)]
 
-  return evaluate(c.abs.expr, env, heap)
+  env = c.env.bind(c.abs.vars, args)
+  roots[-2:] = [env]
+  v = evaluate(c.abs.expr, env, m)
+  roots.pop()
+  return v
 
+@evaluator.register(NewExpr)
 @checked
-def eval_new(e : Expr, stack : dict, heap : list):
+def eval_new(e : Expr, stack : Env, m : Machine):
   
-  v1 = evaluate(e.expr, stack, heap)
-  l1 = Location(len(heap))
-  heap += [v1]
-  return l1
+  v1 = evaluate(e.expr, stack, m)
+  return m.heap.alloc(v1)
 
+@evaluator.register(DerefExpr)
 @checked
-def eval_deref(e : Expr, stack : dict, heap : list):
+def eval_deref(e : Expr, stack : Env, m : Machine):
  
-  l1 = evaluate(e.expr, stack, heap)
+  l1 = evaluate(e.expr, stack, m)
   if type(l1) is not Location:
     raise Exception("invalid reference")
-  return heap[l1.index]
+  return m.heap[l1.index]
 
+@evaluator.register(AssignExpr)
 @checked
-def eval_assign(e : Expr, stack : dict, heap : list):
-  v2 = evaluate(e.rhs, stack, heap)
-  l1 = evaluate(e.lhs, stack, heap)
+def eval_assign(e : Expr, stack : Env, m : Machine):
+  v2 = evaluate(e.rhs, stack, m)
+  m.heap.roots.append(v2)
+  l1 = evaluate(e.lhs, stack, m)
+  m.heap.roots.pop()
   if type(l1) is not Location:
     raise Exception("invalid reference")
-  heap[l1.index] = v2
+  m.heap[l1.index] = v2
+
+@evaluator.register(TupleExpr)
+@checked
+def eval_tuple(e : Expr, stack : Env, m : Machine):
+  vs = []
+  m.heap.roots.append(vs)
+  for x in e.elems:
+    vs += [evaluate(x, stack, m)]
+  m.heap.roots.pop()
+  return Tuple(vs)
+
+@evaluator.register(ProjExpr)
+@checked
+def eval_proj(e : Expr, stack : Env, m : Machine):
+  v1 = evaluate(e.obj, stack, m)
+  return v1.values[e.index]
 
+@evaluator.register(RecordExpr)
+@checked
+def eval_record(e : Expr, stack : Env, m : Machine):
+  fs = []
+  m.heap.roots.append(fs)
+  for f in e.fields:
+    fs += [Field(f.id, evaluate(f.value, stack, m))]
+  m.heap.roots.pop()
+  return Record(fs)
+
+@evaluator.register(MemberExpr)
 @checked
+def eval_member(e : Expr, stack : Env, m : Machine):
+  v1 = evaluate(e.obj, stack, m)
+  return v1.select[e.id]
 
-def eval_variant(e : Expr, stack : dict, heap : list):
-  v1 = evaluate(e.field.value)
+@evaluator.register(VariantExpr)
+@checked
+def eval_variant(e : Expr, stack : Env, m : Machine):
+  v1 = evaluate(e.field.value, stack, m)
   return Variant(e.field.id, v1)
 
-def eval_case(e : Expr, stack : dict, heap : list):
-  v1 = evaluate(e.expr, stack, heap)
+@evaluator.register(CaseExpr)
+def eval_case(e : Expr, stack : Env, m : Machine):
+  v1 = evaluate(e.expr, stack, m)
 
   case = None
   for c in e.cases:
@@ -210,109 +293,14 @@ def eval_case(e : Expr, stack : dict, heap : list):
       break
   assert case != None
 
-  env = clone(stack)
-  env[c.var] = v1.value
-  return evaluate(c.expr, env, heap)
-
-
-def evaluate(e : Expr, stack : dict = {}, heap = []):
-
-
-  if type(e) is BoolExpr:
-    return eval_bool(e, stack, heap)
-
-  if type(e) is AndExpr:
-    return eval_and(e, stack, heap)
-
-  if type(e) is OrExpr:
-    return eval_or(e, stack, heap)
-
-  if type(e) is NotExpr:
-    return eval_not(e, stack, heap)
-
-  if type(e) is IfExpr:
-    return eval_if(e, stack, heap)
-
-  # Arithmetic expressions
-
-  if type(e) is IntExpr:
-    return eval_int(e, stack, heap)
-
-  if type(e) is AddExpr:
-    return eval_add(e, stack, heap)
-
-  if type(e) is SubExpr:
-    return eval_sub(e, stack, heap)
-
-  if type(e) is MulExpr:
-    return eval_mul(e, stack, heap)
-
-  if type(e) is DivExpr:
-    return eval_div(e, stack, heap)
-
-  if type(e) is RemExpr:
-    return eval_rem(e, stack, heap)
-
-  if type(e) is NegExpr:
-    return eval_neg(e, stack, heap)
-
-  # Relational expressions
-
-  if type(e) is EqExpr:
-    return eval_eq(e, stack, heap)
-
-  if type(e) is NeExpr:
-    return eval_ne(e, stack, heap)
-
-  if type(e) is LtExpr:
-    return eval_lt(e, stack, heap)
-
-  if type(e) is GtExpr:
-    return eval_gt(e, stack, heap)
-
-  if type(e) is LeExpr:
-    return eval_le(e, stack, heap)
-
-  if type(e) is GeExpr:
-    return eval_ge(e, stack, heap)
-
-  # Functional expressions
-
-  if type(e) is LambdaExpr:
-    return eval_lambda(e, stack, heap)
-
-  if type(e) is CallExpr:
-    return eval_call(e, stack, heap)
-
-  # Reference expressions
-
-  if type(e) is NewExpr:
-    return eval_new(e, stack, heap)
-
-  if type(e) is DerefExpr:
-    return eval_deref(e, stack, heap)
-
-  if type(e) is AssignExpr:
-    return eval_assign(e, stack, heap)
-
-  # Data expressions
-
-  if type(e) is TupleExpr:
-    return eval_tuple(e, stack, heap)
-
-  if type(e) is ProjExpr:
-    return eval_proj(e, stack, heap)
-
-  if type(e) is RecordExpr:
-    return eval_record(e, stack, heap)
-
-  if type(e) is MemberExpr:
-    return eval_member(e, stack, heap)
-
-  if type(e) is VariantExpr:
-    return eval_variant(e, stack, heap)
-
-  if type(e) is CaseExpr:
-    return eval_case(e, stack, heap)
-
-  assert False
+  env = stack.bind((case.var,), [v1.value])
+  m.heap.roots.append(env)
+  v = evaluate(case.expr, env, m)
+  m.heap.roots.pop()
+  return v
+
+def evaluate(e : Expr, stack : Env = None, m : Machine = None):
+  if m is None or stack is None:
+    # A top-level call without a machine gets a fresh one of its own.
+    return (m or Machine()).run(e, stack)
+  return m.table[type(e)](e, stack, m)
@@ -0,0 +1,185 @@
+from lang import *
+from dispatch import Dispatch, Table
+from reduce import is_value, is_reducible
+from substitute import subst, free_vars, freevars
+
+# Reduction with explicit substitutions.
+#
+# step_call in reduce.py substitutes the arguments into the whole body of
+# the called lambda at once, even into parts that are later thrown away,
+# such as the branch of an if that is not taken. This engine instead makes
+# the substitution a node of the term: a beta step turns
+#
+#   (\(x1, ..., xn). b)(v1, ..., vn)    into    b[x1 := v1, ...]
+#
+# a Sub node holding b and the pending substitution, and a Sub is only
+# pushed one level down, onto the children of b, when the reduction needs
+# to look inside it. A substitution reaching another Sub is merged with
+# it, so several pending substitutions travel down together as one. Parts
+# of a body that are never inspected are never copied, and subtrees with
+# no free variable in the substitution are shared as they are.
+#
+# The contraction rules and the order in which redexes are chosen are those
+# of reduce.py, so reduce_explicit(e) gives the same value as reduce(e).
+# Values that still hold pending substitutions (lambda bodies) are expanded
+# at the end, so the result is the same term as well.
+#
+#   v, stats = reduce_explicit(e)
+#   print(v, stats.beta, stats.sigma)
+
+
+class Sub(Expr):
+  # e with the substitution s (VarDecl -> value) pending.
+  __slots__ = ("expr", "sub")
+
+  def __init__(self, e, s):
+    Expr.__init__(self)
+    self.expr = e
+    self.sub = s
+
+  def __str__(self):
+    s = ",".join(f"{x.id}:={v}" for x, v in self.sub.items())
+    return f"{self.expr}[{s}]"
+
+@freevars.register(Sub)
+def free_sub(e):
+  # The substituted values are closed, so only the body's other variables
+  # remain free.
+  return free_vars(e.expr).difference(e.sub)
+
+
+def delay(e, s):
+  # e under s, without doing any of the work yet.
+  if s.keys().isdisjoint(free_vars(e)):
+    return e
+  if type(e) is Sub:
+    # e.sub is applied first; its values are closed, so merging keeps
+    # its bindings over those of s.
+    return Sub(e.expr, {**s, **e.sub})
+  return Sub(e, s)
+
+
+pusher = Dispatch("push")
+
+@pusher.register(BoolExpr, IntExpr)
+def push_literal(e, s):
+  return e
+
+@pusher.register(IdExpr)
+def push_id(e, s):
+  return s.get(e.ref, e)
+
+@pusher.register(AndExpr, OrExpr)
+def push_binary(e, s):
+  return type(e)(delay(e.lhs, s), delay(e.rhs, s))
+
+@pusher.register(NotExpr)
+def push_not(e, s):
+  return NotExpr(delay(e.expr, s))
+
+@pusher.register(IfExpr)
+def push_if(e, s):
+  return IfExpr(delay(e.cond, s), delay(e.true, s), delay(e.false, s))
+
+@pusher.register(LambdaExpr)
+def push_lambda(e, s):
+  return LambdaExpr(e.vars, delay(e.expr, s))
+
+@pusher.register(CallExpr)
+def push_call(e, s):
+  return CallExpr(delay(e.fn, s), [delay(a, s) for a in e.args])
+
+push_table = pusher.table
+
+
+class Stats:
+  def __init__(self):
+    self.beta = 0
+    self.sigma = 0
+
+  def __str__(self):
+    return f"{self.beta} beta steps, {self.sigma} substitution steps"
+
+
+class Engine:
+
+  def __init__(self):
+    self.stats = Stats()
+    self.table = Table("explicit", {
+      Sub: self.step_sub,
+      AndExpr: self.step_binary,
+      OrExpr: self.step_binary,
+      NotExpr: self.step_not,
+      IfExpr: self.step_if,
+      CallExpr: self.step_call,
+    })
+
+  def step(self, e):
+    return self.table[type(e)](e)
+
+  def step_sub(self, e):
+    self.stats.sigma += 1
+    return push_table[type(e.expr)](e.expr, e.sub)
+
+  def step_binary(self, e):
+    if is_reducible(e.lhs):
+      return type(e)(self.step(e.lhs), e.rhs)
+    if is_reducible(e.rhs):
+      return type(e)(e.lhs, self.step(e.rhs))
+    if type(e) is AndExpr:
+      return BoolExpr(e.lhs.value and e.rhs.value)
+    return BoolExpr(e.lhs.value or e.rhs.value)
+
+  def step_not(self, e):
+    if is_reducible(e.expr):
+      return NotExpr(self.step(e.expr))
+    return BoolExpr(not e.expr.value)
+
+  def step_if(self, e):
+    if is_reducible(e.cond):
+      return IfExpr(self.step(e.cond), e.true, e.false)
+    if e.cond.value:
+      return e.true
+    else:
+      return e.false
+
+  def step_call(self, e):
+    if is_reducible(e.fn):
+      return CallExpr(self.step(e.fn), e.args)
+
+    if len(e.args) < len(e.fn.vars):
+      raise Exception("too few arguments")
+    if len(e.args) > len(e.fn.vars):
+      raise Exception("too many arguments")
+
+    for i in range(len(e.args)):
+      if is_reducible(e.args[i]):
+        return CallExpr(e.fn, e.args[:i] + [self.step(e.args[i])] + e.args[i+1:])
+
+    self.stats.beta += 1
+    return delay(e.fn.expr, dict(zip(e.fn.vars, e.args)))
+
+
+def expand(e):
+  # e with every pending substitution carried out.
+  if type(e) is Sub:
+    return subst(expand(e.expr), {x: expand(v) for x, v in e.sub.items()})
+  if type(e) is LambdaExpr:
+    body = expand(e.expr)
+    return e if body is e.expr else LambdaExpr(e.vars, body)
+  if type(e) in (AndExpr, OrExpr):
+    return type(e)(expand(e.lhs), expand(e.rhs))
+  if type(e) is NotExpr:
+    return NotExpr(expand(e.expr))
+  if type(e) is IfExpr:
+    return IfExpr(expand(e.cond), expand(e.true), expand(e.false))
+  if type(e) is CallExpr:
+    return CallExpr(expand(e.fn), [expand(a) for a in e.args])
+  return e
+
+def reduce_explicit(e : Expr):
+  # The value of e, as reduce(e) computes it, and the step counts.
+  engine = Engine()
+  while not is_value(e):
+    e = engine.step(e)
+  return expand(e), engine.stats
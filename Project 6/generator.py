@@ -0,0 +1,279 @@
+from lang import *
+from runner import save_programs
+
+import random
+
+# Random well-typed programs.
+#
+# Generator(seed).program(n) builds an unresolved expression of about n
+# nodes that resolves, checks and evaluates without error. The same seed
+# and settings always give the same program. The shape is controlled by:
+#
+#   depth     how deeply expressions nest. Programs larger than the depth
+#             allows grow wide instead, through tuples and records.
+#   lambdas   how often a subexpression is computed by calling a lambda
+#   data      how often tuples, records and variants are built and taken
+#             apart
+#   heap      how often a value goes through a reference, with new, * and
+#             assignment
+#
+# each a weight between 0 and 1. To go past what fits in memory,
+# Generator.stream writes a corpus of independent programs totalling n
+# nodes, one at a time, in the format of runner.save_programs:
+#
+#   Generator(1).stream("corpus.pkl", 10 ** 7, size = 10 ** 4)
+#   for e in runner.load_programs("corpus.pkl"):
+#     ...
+#
+# Only Int, Bool and the type constructors of the language are generated.
+# Division and remainder are left out, since they can fail at run time,
+# and so are multiplications of two computed values, which grow without
+# bound.
+
+
+class Scope:
+  # The variables in scope, by printed type.
+
+  def __init__(self):
+    self.vars = {}
+
+  def add(self, var):
+    self.vars.setdefault(str(var.type), []).append(var)
+
+  def remove(self, var):
+    self.vars[str(var.type)].pop()
+
+  def pick(self, t, rnd):
+    vs = self.vars.get(str(t))
+    if vs:
+      return rnd.choice(vs)
+    return None
+
+
+class Generator:
+
+  def __init__(self, seed = 0, depth = 12, lambdas = 0.15, data = 0.15, heap = 0.1):
+    self.rnd = random.Random(seed)
+    self.depth = depth
+    self.lambdas = lambdas
+    self.data = data
+    self.heap = heap
+    self.names = 0
+
+  def fresh(self, prefix):
+    self.names += 1
+    return f"{prefix}{self.names}"
+
+  # Types
+
+  def scalar(self):
+    return intType if self.rnd.random() < 0.6 else boolType
+
+  def type(self, d = 2):
+    r = self.rnd.random()
+    if d == 0 or r < 0.6:
+      return self.scalar()
+    if r < 0.7:
+      return FnType([self.type(d - 1) for _ in range(self.rnd.randint(1, 3))], self.type(d - 1))
+    if r < 0.8:
+      return RefType(self.type(d - 1))
+    if r < 0.87:
+      return TupleType([self.type(d - 1) for _ in range(self.rnd.randint(1, 4))])
+    if r < 0.94:
+      return RecordType([(f"f{i}", self.type(d - 1)) for i in range(self.rnd.randint(1, 4))])
+    return VariantType([(f"t{i}", self.type(d - 1)) for i in range(self.rnd.randint(1, 4))])
+
+  # Expressions
+
+  def split(self, n, k):
+    # n - 1 nodes shared randomly among k children, each getting at least 1.
+    n = max(n - 1, k)
+    cuts = sorted(self.rnd.randint(0, n - k) for _ in range(k - 1))
+    sizes = []
+    prev = 0
+    for c in cuts + [n - k]:
+      sizes += [c - prev + 1]
+      prev = c
+    return sizes
+
+  def program(self, n):
+    self.scope = Scope()
+    return self.expr(self.scalar(), n, 0)
+
+  def expr(self, t, n, d):
+    if n <= 1 or d >= self.depth:
+      return self.leaf(t, d)
+
+    rnd = self.rnd
+    # Too big to fit in the remaining depth as a binary tree: go wide.
+    if n > 4 << max(0, self.depth - d) and type(t) in (IntType, BoolType):
+      return self.wide(t, n, d)
+
+    r = rnd.random()
+    if r < self.lambdas:
+      return self.call(t, n, d)
+    r -= self.lambdas
+    if r < self.data:
+      return self.unpack(t, n, d)
+    r -= self.data
+    if r < self.heap:
+      return self.through_ref(t, n, d)
+
+    if type(t) is IntType:
+      return self.int(n, d)
+    if type(t) is BoolType:
+      return self.bool(n, d)
+    return self.build(t, n, d)
+
+  def leaf(self, t, d):
+    var = self.scope.pick(t, self.rnd)
+    if var is not None and self.rnd.random() < 0.7:
+      return IdExpr(var)
+    if type(t) is IntType:
+      return IntExpr(self.rnd.randint(0, 100))
+    if type(t) is BoolType:
+      return BoolExpr(self.rnd.random() < 0.5)
+    return self.build(t, len(self.parts(t)) + 1, d)
+
+  def int(self, n, d):
+    rnd = self.rnd
+    r = rnd.random()
+    if r < 0.1:
+      return NegExpr(self.expr(intType, n - 1, d + 1))
+    if r < 0.2:
+      return MulExpr(self.expr(intType, n - 2, d + 1), IntExpr(rnd.randint(-3, 3)))
+    if r < 0.35:
+      a, b, c = self.split(n, 3)
+      return IfExpr(self.expr(boolType, a, d + 1), self.expr(intType, b, d + 1), self.expr(intType, c, d + 1))
+    a, b = self.split(n, 2)
+    op = AddExpr if r < 0.7 else SubExpr
+    return op(self.expr(intType, a, d + 1), self.expr(intType, b, d + 1))
+
+  def bool(self, n, d):
+    rnd = self.rnd
+    r = rnd.random()
+    if r < 0.1:
+      return NotExpr(self.expr(boolType, n - 1, d + 1))
+    if r < 0.25:
+      a, b, c = self.split(n, 3)
+      return IfExpr(self.expr(boolType, a, d + 1), self.expr(boolType, b, d + 1), self.expr(boolType, c, d + 1))
+    a, b = self.split(n, 2)
+    if r < 0.55:
+      op = rnd.choice([EqExpr, NeExpr, LtExpr, GtExpr, LeExpr, GeExpr])
+      return op(self.expr(intType, a, d + 1), self.expr(intType, b, d + 1))
+    op = AndExpr if r < 0.8 else OrExpr
+    return op(self.expr(boolType, a, d + 1), self.expr(boolType, b, d + 1))
+
+  def wide(self, t, n, d):
+    # A tuple or record of many scalars, one of which has type t.
+    k = min(max(2, n // (4 << max(0, self.depth - d - 1)) + 1), 1000)
+    sizes = self.split(n, k)
+    i = self.rnd.randrange(k)
+    ts = [t if j == i else self.scalar() for j in range(k)]
+    es = [self.expr(ts[j], sizes[j], d + 1) for j in range(k)]
+    if self.rnd.random() < 0.5:
+      return ProjExpr(TupleExpr(es), i)
+    return MemberExpr(RecordExpr([(f"f{j}", es[j]) for j in range(k)]), f"f{i}")
+
+  def call(self, t, n, d):
+    # (\(x1, ...). body)(a1, ...), the lambda sometimes passed through a
+    # variable of function type.
+    k = self.rnd.randint(1, 3)
+    ps = [self.type(1) for _ in range(k)]
+    sizes = self.split(n, k + 1)
+    fn = self.lambda_(FnType(ps, t), sizes[0], d + 1)
+    args = [self.expr(p, sizes[i + 1], d + 1) for i, p in enumerate(ps)]
+    return CallExpr(fn, args)
+
+  def lambda_(self, t, n, d):
+    vs = [VarDecl(self.fresh("x"), p) for p in t.parms]
+    for v in vs:
+      self.scope.add(v)
+    body = self.expr(t.ret, n - 1, d + 1)
+    for v in reversed(vs):
+      self.scope.remove(v)
+    return LambdaExpr(vs, body)
+
+  def unpack(self, t, n, d):
+    # Takes a t out of a tuple, record or variant built for the purpose.
+    rnd = self.rnd
+    k = rnd.randint(1, 4)
+    r = rnd.random()
+    ts = [self.type(1) for _ in range(k)]
+    i = rnd.randrange(k)
+    ts[i] = t
+
+    if r < 0.35:
+      return ProjExpr(self.expr(TupleType(ts), n - 1, d + 1), i)
+    if r < 0.7:
+      rt = RecordType([(f"f{j}", ts[j]) for j in range(k)])
+      return MemberExpr(self.expr(rt, n - 1, d + 1), f"f{i}")
+
+    # case v of <t0=x> => e0 | ...; every arm has type t.
+    vt = VariantType([(f"t{j}", ts[j]) for j in range(k)])
+    sizes = self.split(n, k + 1)
+    v = self.expr(vt, sizes[0], d + 1)
+    cases = []
+    for j in range(k):
+      x = self.fresh("c")
+      # check_case gives case variables their type from the variant.
+      var = VarDecl(x, ts[j])
+      self.scope.add(var)
+      arm = self.expr(t, sizes[j + 1], d + 1)
+      self.scope.remove(var)
+      cases += [(f"t{j}", x, arm)]
+    return CaseExpr(v, cases)
+
+  def through_ref(self, t, n, d):
+    # *(new e), or {r = e2, *r}.1 with r a new cell.
+    if self.rnd.random() < 0.5:
+      return DerefExpr(NewExpr(self.expr(t, n - 2, d + 2)))
+
+    a, b = self.split(n - 4, 2)
+    r = VarDecl(self.fresh("r"), RefType(t))
+    body = ProjExpr(TupleExpr([
+      AssignExpr(IdExpr(r), self.expr(t, a, d + 2)),
+      DerefExpr(IdExpr(r)),
+    ]), 1)
+    init = NewExpr(self.expr(t, b, d + 2))
+    return CallExpr(LambdaExpr([r], body), [init])
+
+  def parts(self, t):
+    if type(t) is FnType:
+      return [t.ret]
+    if type(t) is RefType:
+      return [t.ref]
+    if type(t) is TupleType:
+      return t.elems
+    if type(t) is RecordType:
+      return [f.type for f in t.fields]
+    if type(t) is VariantType:
+      return [t.fields[0].type]
+    return []
+
+  def build(self, t, n, d):
+    # A value of a compound type, from its constructor.
+    if type(t) is FnType:
+      return self.lambda_(t, n, d)
+
+    ts = self.parts(t)
+    sizes = self.split(n, len(ts))
+    es = [self.expr(p, s, d + 1) for p, s in zip(ts, sizes)]
+    if type(t) is RefType:
+      return NewExpr(es[0])
+    if type(t) is TupleType:
+      return TupleExpr(es)
+    if type(t) is RecordType:
+      return RecordExpr([(f.id, e) for f, e in zip(t.fields, es)])
+    f = t.fields[0]
+    return VariantExpr((f.id, es[0]), t)
+
+  def programs(self, total, size):
+    # Independent programs of about `size` nodes, about `total` in all.
+    while total > 0:
+      n = min(size, total)
+      yield self.program(n)
+      total -= n
+
+  def stream(self, path, total, size = 10000):
+    save_programs(path, self.programs(total, size))
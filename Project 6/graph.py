@@ -0,0 +1,182 @@
+from lang import *
+from substitute import subst, substituter, freevars, free_vars
+
+import time
+
+# Graph reduction.
+#
+# reduce.py copies each argument into every place its parameter occurs. If
+# the arguments were not reduced first, as in normal-order reduction to full
+# normal form, each copy would be reduced separately, and terms that pass
+# unevaluated arguments on to functions using them twice do exponentially
+# more work. Here a beta step wraps each argument in a Share node, and
+# every occurrence of the parameter refers to that one node. The first time
+# it is reduced, the node is updated in place with the result, so all
+# other occurrences see the reduced term.
+#
+# Reduction is in normal order: a function is reduced before its
+# arguments, and an argument is reduced only when it is needed. Terms whose
+# head is a free variable are stuck and are left as they are. whnf(e)
+# reduces to weak head normal form, and normalize(e) also reduces under
+# lambdas and inside stuck terms, to the full normal form. On closed terms
+# that reduce() can finish, both give the same value as reduce().
+#
+#   g = Graph()
+#   v = g.normalize(e)
+#   print(v, g.beta)
+#
+# Graph(share = False) substitutes the argument terms themselves, as
+# reduce.py does, for comparison.
+
+WHNF, NORMAL = 1, 2
+
+
+class Share(Expr):
+  # A shared argument. expr is replaced with its reduced form once that is
+  # known, and state records how far it has been reduced.
+  __slots__ = ("expr", "state")
+
+  def __init__(self, e):
+    Expr.__init__(self)
+    self.expr = e
+    self.state = 0
+
+  def __str__(self):
+    return str(self.expr)
+
+# Reducing the shared term only ever removes free variables, so a set
+# cached before an update still contains every variable free after it.
+@freevars.register(Share)
+def free_share(e):
+  return free_vars(e.expr)
+
+@substituter.register(Share)
+def subst_share(e, s):
+  # Only reached when the shared term has a variable of s free, so it
+  # differs in each copy and cannot be shared between them.
+  return Share(subst(e.expr, s))
+
+
+class Graph:
+
+  def __init__(self, share = True):
+    self.share = share
+    self.beta = 0
+    # Names of the binders normalize() is under.
+    self.scope = []
+
+  def shared(self, e):
+    if not self.share or type(e) in (BoolExpr, IntExpr, IdExpr, Share):
+      return e
+    return Share(e)
+
+  def whnf(self, e):
+    # Calls and ifs loop rather than recurse, so long chains of calls in
+    # tail position do not use up the Python stack.
+    while True:
+      k = type(e)
+
+      if k is Share:
+        if not e.state:
+          e.expr = self.whnf(e.expr)
+          e.state = WHNF
+        return e.expr
+
+      if k is CallExpr:
+        f = self.whnf(e.fn)
+        if type(f) is not LambdaExpr:
+          return CallExpr(f, e.args)
+        if len(e.args) < len(f.vars):
+          raise Exception("too few arguments")
+        if len(e.args) > len(f.vars):
+          raise Exception("too many arguments")
+        self.beta += 1
+        e = subst(f.expr, {x: self.shared(a) for x, a in zip(f.vars, e.args)})
+        continue
+
+      if k is IfExpr:
+        c = self.whnf(e.cond)
+        if type(c) is not BoolExpr:
+          return IfExpr(c, e.true, e.false)
+        e = e.true if c.value else e.false
+        continue
+
+      # As in reduce.py, both operands are reduced.
+      if k is AndExpr or k is OrExpr:
+        l = self.whnf(e.lhs)
+        r = self.whnf(e.rhs)
+        if type(l) is not BoolExpr or type(r) is not BoolExpr:
+          return k(l, r)
+        if k is AndExpr:
+          return BoolExpr(l.value and r.value)
+        return BoolExpr(l.value or r.value)
+
+      if k is NotExpr:
+        x = self.whnf(e.expr)
+        if type(x) is not BoolExpr:
+          return NotExpr(x)
+        return BoolExpr(not x.value)
+
+      if k in (BoolExpr, IntExpr, IdExpr, LambdaExpr):
+        return e
+
+      raise Exception(f"graph: no rule for {k.__name__}")
+
+  def fresh(self, id):
+    while id in self.scope:
+      id += "'"
+    return id
+
+  def normalize(self, e):
+    if type(e) is Share:
+      if e.state != NORMAL:
+        e.expr = self.normalize(e.expr)
+        e.state = NORMAL
+      return e.expr
+
+    e = self.whnf(e)
+    k = type(e)
+
+    if k is LambdaExpr:
+      # Copies of a lambda made by beta steps share its VarDecls, so a term
+      # with one copy's parameter free could be substituted under another
+      # copy's binder and be captured. Giving every lambda that is reduced
+      # under its own binders first rules that out.
+      n = len(self.scope)
+      vars = []
+      for v in e.vars:
+        x = VarDecl(self.fresh(v.id), v.type)
+        self.scope.append(x.id)
+        vars.append(x)
+      body = subst(e.expr, {v: IdExpr(x) for v, x in zip(e.vars, vars)})
+      body = self.normalize(body)
+      del self.scope[n:]
+      return LambdaExpr(vars, body)
+
+    # The rest are stuck on a free variable, or already normal.
+    if k is CallExpr:
+      return CallExpr(self.normalize(e.fn), [self.normalize(a) for a in e.args])
+    if k is IfExpr:
+      return IfExpr(self.normalize(e.cond), self.normalize(e.true), self.normalize(e.false))
+    if k is AndExpr or k is OrExpr:
+      return k(self.normalize(e.lhs), self.normalize(e.rhs))
+    if k is NotExpr:
+      return NotExpr(self.normalize(e.expr))
+    return e
+
+
+class Result:
+  def __init__(self, value, beta, seconds):
+    self.value = value
+    self.beta = beta
+    self.seconds = seconds
+
+  def __str__(self):
+    return f"{self.value}: {self.beta} beta steps in {self.seconds * 1e3:.3f} ms"
+
+def reduce_graph(e : Expr, normal = True, share = True):
+  # The full normal form of e, or its weak head normal form if not normal.
+  g = Graph(share)
+  t0 = time.perf_counter()
+  v = g.normalize(e) if normal else g.whnf(e)
+  return Result(v, g.beta, time.perf_counter() - t0)
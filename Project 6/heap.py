@@ -0,0 +1,188 @@
+from dispatch import Dispatch
+from env import Env, Frame
+
+import contextlib
+import time
+
+# The evaluator heap, with an optional mark-and-sweep collector.
+#
+# Cells are addressed by Location and never move: the sweep puts dead cells
+# on a free list that later allocations reuse, so Location indices stay
+# valid without any fix-ups.
+#
+# The collector only runs inside alloc(), once the number of live cells
+# reaches `threshold` (None, the default, never collects). Everything it
+# can reach from `roots` survives. The evaluator keeps `roots` up to date:
+# it pushes the environment of every active call and case arm, and any
+# value it holds in a Python local while evaluating another subexpression.
+# Code that keeps heap values in Python locals across an allocation without
+# rooting them, such as the compiled backends, runs inside
+# heap.uncollected(), which turns collection off until it returns.
+#
+# A Heap built with a `limit` refuses to grow past that many cells, after
+# collecting if it can, so one runaway evaluation cannot take all memory.
+#
+# What a value refers to is looked up in `tracer`, keyed by the value's
+# class; value types register their own rule.
+
+tracer = Dispatch("trace")
+
+
+class Location:
+  __slots__ = ("index",)
+
+  def __init__(self, ix):
+    self.index = ix
+
+  def __str__(self):
+    return f"@{self.index}"
+
+
+class Free:
+  # Marks a swept cell.
+  __slots__ = ()
+
+  def __str__(self):
+    return "<free>"
+
+free = Free()
+
+
+class GcStats:
+  __slots__ = ("allocations", "collections", "freed", "pause", "max_pause")
+
+  def __init__(self):
+    self.allocations = 0
+    self.collections = 0
+    self.freed = 0
+    self.pause = 0.0
+    self.max_pause = 0.0
+
+  def __str__(self):
+    return f"{self.allocations} allocations, {self.collections} collections, " \
+      f"{self.freed} cells freed, {self.pause * 1e3:.3f} ms paused " \
+      f"(max {self.max_pause * 1e3:.3f} ms)"
+
+
+class Heap:
+
+  def __init__(self, threshold = None, limit = None):
+    self.cells = []
+    self.free = []
+    self.roots = []
+    self.threshold = self.initial = threshold
+    self.limit = limit
+    self.stats = GcStats()
+
+  def alloc(self, v):
+    self.stats.allocations += 1
+    if not self.free and self.threshold is not None and len(self.cells) >= self.threshold:
+      self.collect(v)
+      # Grow when most of the heap survives, so that a heap which is
+      # genuinely large is not collected on every allocation.
+      if 2 * self.live() > self.threshold:
+        self.threshold = 2 * self.live()
+
+    if not self.free and self.limit is not None and len(self.cells) >= self.limit:
+      raise Exception("heap limit exceeded")
+
+    if self.free:
+      ix = self.free.pop()
+      self.cells[ix] = v
+    else:
+      ix = len(self.cells)
+      self.cells.append(v)
+    return Location(ix)
+
+  def __getitem__(self, ix):
+    return self.cells[ix]
+
+  def __setitem__(self, ix, v):
+    self.cells[ix] = v
+
+  def __len__(self):
+    return len(self.cells)
+
+  def reset(self):
+    # Empties the heap in place; roots is shared with the evaluator.
+    self.cells.clear()
+    self.free.clear()
+    self.roots.clear()
+    self.threshold = self.initial
+    self.stats = GcStats()
+
+  @contextlib.contextmanager
+  def uncollected(self):
+    threshold = self.threshold
+    self.threshold = None
+    try:
+      yield self
+    finally:
+      self.threshold = threshold
+
+  def live(self):
+    return len(self.cells) - len(self.free)
+
+  def mark(self, *extra):
+    cells = self.cells
+    marked = bytearray(len(cells))
+    seen = set()
+    table = tracer.table
+
+    todo = list(self.roots)
+    todo += extra
+    while todo:
+      v = todo.pop()
+      if type(v) is Location:
+        if not marked[v.index]:
+          marked[v.index] = 1
+          todo.append(cells[v.index])
+        continue
+
+      fn = table.get(type(v))
+      if fn is None or id(v) in seen:
+        continue
+      seen.add(id(v))
+      todo += fn(v)
+    return marked
+
+  def collect(self, *extra):
+    t0 = time.perf_counter()
+    marked = self.mark(*extra)
+
+    cells = self.cells
+    freed = 0
+    for ix in range(len(cells)):
+      if not marked[ix] and cells[ix] is not free:
+        cells[ix] = free
+        self.free.append(ix)
+        freed += 1
+
+    pause = time.perf_counter() - t0
+    self.stats.collections += 1
+    self.stats.freed += freed
+    self.stats.pause += pause
+    self.stats.max_pause = max(self.stats.max_pause, pause)
+    return freed
+
+  def __str__(self):
+    return f"heap: {self.live()}/{len(self.cells)} cells live; {self.stats}"
+
+
+@tracer.register(list)
+def trace_list(vs):
+  return vs
+
+@tracer.register(Env)
+def trace_env(env):
+  out = list(env.bindings.values())
+  if env.parent is not None:
+    out += [env.parent]
+  return out
+
+@tracer.register(Frame)
+def trace_frame(env):
+  out = list(env.values)
+  if env.parent is not None:
+    out += [env.parent]
+  return out
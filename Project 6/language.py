@@ -1,12 +1,19 @@
+from checking import checked
+
 class VarDecl:
+  __slots__ = ("id", "type", "slot")
+
   def __init__(self, id, t):
     self.id = id
     self.type = typify(t)
+    self.slot = None
 
   def __str__(self):
     return f"{self.id}:{str(self.type)}"
 
 class FieldDecl:
+  __slots__ = ("id", "type")
+
   def __init__(self, id, t):
     self.id = id
     self.type = typify(t)
@@ -15,6 +22,8 @@ class FieldDecl:
     return f"{self.id}:{str(self.type)}"
 
 class FieldInit:
+  __slots__ = ("id", "value")
+
   def __init__(self, id, e):
     self.id = id
     self.value = expr(e)
@@ -23,17 +32,23 @@ class FieldInit:
     return f"{self.id}={str(self.value)}"
 
 class Type:
-  pass
+  __slots__ = ()
 
 class BoolType(Type):
+  __slots__ = ()
+
   def __str__(self):
     return "Bool"
 
 class IntType(Type):
+  __slots__ = ()
+
   def __str__(self):
     return "Int"
 
 class FnType(Type):
+  __slots__ = ("parms", "ret")
+
   def __init__(self, parms, ret):
     self.parms = list(map(typify, parms))
     self.ret = typify(ret)
@@ -43,6 +58,8 @@ class FnType(Type):
     return f"({parms})->{str(self.ret)}"
 
 class RefType(Type):
+  __slots__ = ("ref",)
+
   def __init__(self, t):
     self.ref = typify(t)
 
@@ -50,6 +67,8 @@ class RefType(Type):
     return f"Ref {str(self.ref)}"
 
 class TupleType(Type):
+  __slots__ = ("elems",)
+
   def __init__(self, ts):
     self.elems = list(map(typify, ts))
 
@@ -58,6 +77,8 @@ class TupleType(Type):
     return f"{{{es}}}"
 
 class RecordType(Type):
+  __slots__ = ("fields",)
+
   def __init__(self, fs):
     self.fields = list(map(field, fs))
 
@@ -66,6 +87,8 @@ class RecordType(Type):
     return f"{{{fs}}}"
 
 class VariantType(Type):
+  __slots__ = ("fields",)
+
   def __init__(self, fs):
     self.fields = list(map(field, fs))
 
@@ -79,11 +102,17 @@ intType = IntType()
 
 
 class Expr:
+  __slots__ = ("type", "free")
+
   def __init__(self):
     self.type = None
+    # The VarDecls free in this node, computed on demand by free_vars().
+    self.free = None
 
 
 class BoolExpr(Expr):
+  __slots__ = ("value",)
+
   def __init__(self, val):
     Expr.__init__(self)
     self.value = val
@@ -92,6 +121,8 @@ class BoolExpr(Expr):
     return "true" if self.value else "false"
 
 class AndExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, e1, e2):
     Expr.__init__(self)
     self.lhs = expr(e1)
@@ -101,6 +132,8 @@ class AndExpr(Expr):
     return f"({self.lhs} and {self.rhs})"
 
 class OrExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, e1, e2):
     Expr.__init__(self)
     self.lhs = expr(e1)
@@ -110,6 +143,8 @@ class OrExpr(Expr):
     return f"({self.lhs} or {self.rhs})"
 
 class NotExpr(Expr):
+  __slots__ = ("expr",)
+
   def __init__(self, e1):
     Expr.__init__(self)
     self.expr = expr(e1)
@@ -118,6 +153,8 @@ class NotExpr(Expr):
     return f"(not {self.expr})"
 
 class IfExpr(Expr):
+  __slots__ = ("cond", "true", "false")
+
   def __init__(self, e1, e2, e3):
     Expr.__init__(self)
     self.cond = expr(e1)
@@ -129,6 +166,8 @@ class IfExpr(Expr):
 
 
 class IdExpr(Expr):
+  __slots__ = ("id", "ref", "depth", "slot")
+
   def __init__(self, x):
     Expr.__init__(self)
     if type(x) is str:
@@ -138,11 +177,19 @@ class IdExpr(Expr):
       self.id = x.id
       self.ref = x
 
+    # Lexical address of ref, set by resolve: the number of enclosing
+    # scopes between this use and its declaration, and the declaration's
+    # position in its scope.
+    self.depth = None
+    self.slot = None
+
   def __str__(self):
     return self.id
 
 
 class IntExpr(Expr):
+  __slots__ = ("value",)
+
   def __init__(self, val):
     Expr.__init__(self)
     self.value = val
@@ -151,6 +198,8 @@ class IntExpr(Expr):
     return str(self.value)
 
 class AddExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, lhs, rhs):
     Expr.__init__(self)
     self.lhs = expr(lhs)
@@ -160,6 +209,8 @@ class AddExpr(Expr):
     return f"({self.lhs} + {self.rhs})"
 
 class SubExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, lhs, rhs):
     Expr.__init__(self)
     self.lhs = expr(lhs)
@@ -169,6 +220,8 @@ class SubExpr(Expr):
     return f"({self.lhs} + {self.rhs})"
 
 class MulExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, lhs, rhs):
     Expr.__init__(self)
     self.lhs = expr(lhs)
@@ -178,6 +231,8 @@ class MulExpr(Expr):
     return f"({self.lhs} - {self.rhs})"
 
 class DivExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, lhs, rhs):
     Expr.__init__(self)
     self.lhs = expr(lhs)
@@ -187,6 +242,8 @@ class DivExpr(Expr):
     return f"({self.lhs} / {self.rhs})"
 
 class RemExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, lhs, rhs):
     Expr.__init__(self)
     self.lhs = expr(lhs)
@@ -196,6 +253,8 @@ class RemExpr(Expr):
     return f"({self.lhs} % {self.rhs})"
 
 class NegExpr(Expr):
+  __slots__ = ("expr",)
+
   def __init__(self, e1):
     Expr.__init__(self)
     self.expr = expr(e1)
@@ -205,6 +264,8 @@ class NegExpr(Expr):
 
 
 class EqExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, lhs, rhs):
     Expr.__init__(self)
     self.lhs = expr(lhs)
@@ -214,6 +275,8 @@ class EqExpr(Expr):
     return f"({self.lhs} == {self.rhs})"
 
 class NeExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, lhs, rhs):
     Expr.__init__(self)
     self.lhs = expr(lhs)
@@ -223,6 +286,8 @@ class NeExpr(Expr):
     return f"({self.lhs} != {self.rhs})"
 
 class LtExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, lhs, rhs):
     Expr.__init__(self)
     self.lhs = expr(lhs)
@@ -232,6 +297,8 @@ class LtExpr(Expr):
     return f"({self.lhs} < {self.rhs})"
 
 class GtExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, lhs, rhs):
     Expr.__init__(self)
     self.lhs = expr(lhs)
@@ -241,6 +308,8 @@ class GtExpr(Expr):
     return f"({self.lhs} > {self.rhs})"
 
 class LeExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, lhs, rhs):
     Expr.__init__(self)
     self.lhs = expr(lhs)
@@ -250,6 +319,8 @@ class LeExpr(Expr):
     return f"({self.lhs} <= {self.rhs})"
 
 class GeExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, lhs, rhs):
     Expr.__init__(self)
     self.lhs = expr(lhs)
@@ -260,6 +331,7 @@ class GeExpr(Expr):
 
 
 class LambdaExpr(Expr):
+  __slots__ = ("vars", "expr")
  
   def __init__(self, vars, e1):
     Expr.__init__(self)
@@ -271,6 +343,7 @@ class LambdaExpr(Expr):
     return f"\\({parms}).{self.expr}"
 
 class CallExpr(Expr):
+  __slots__ = ("fn", "args")
  
   def __init__(self, fn, args):
     Expr.__init__(self)
@@ -282,6 +355,8 @@ class CallExpr(Expr):
     return f"{self.fn} ({args})"
 
 class PlaceholderExpr(Expr):
+  __slots__ = ()
+
   def __init__(self):
     Expr.__init__(self)
 
@@ -290,6 +365,7 @@ class PlaceholderExpr(Expr):
 
 
 class NewExpr(Expr):
+  __slots__ = ("expr",)
 
   def __init__(self, e):
     Expr.__init__(self)
@@ -299,6 +375,7 @@ class NewExpr(Expr):
     return f"new {self.expr}"
 
 class DerefExpr(Expr):
+  __slots__ = ("expr",)
 
   def __init__(self, e):
     Expr.__init__(self)
@@ -308,6 +385,7 @@ class DerefExpr(Expr):
     return f"*{self.expr}"
 
 class AssignExpr(Expr):
+  __slots__ = ("lhs", "rhs")
   # Represents assignment.
   def __init__(self, e1, e2):
     Expr.__init__(self)
@@ -319,6 +397,8 @@ class AssignExpr(Expr):
 
 # Data expressions
 class TupleExpr(Expr):
+  __slots__ = ("elems",)
+
   def __init__(self, es):
     Expr.__init__(self)
     self.elems = list(map(expr, es))
@@ -328,6 +408,8 @@ class TupleExpr(Expr):
     return f"{{{es}}}"
 
 class ProjExpr(Expr):
+  __slots__ = ("obj", "index")
+
   def __init__(self, e1, n):
     Expr.__init__(self)
     self.obj = e1
@@ -337,6 +419,8 @@ class ProjExpr(Expr):
     return f"{str(self.obj)}.{self.index}"
 
 class RecordExpr(Expr):
+  __slots__ = ("fields",)
+
   def __init__(self, fs):
     Expr.__init__(self)
     self.fields = list(map(init, fs))
@@ -346,18 +430,20 @@ class RecordExpr(Expr):
     return f"{{{fs}}}"
 
 class MemberExpr(Expr):
+  __slots__ = ("obj", "id", "ref")
+
   def __init__(self, e1, id):
     Expr.__init__(self)
     self.obj = e1
     self.id = id
-
-
-    self.Ref = None
+    # The field's declaration, set by check.
+    self.ref = None
 
   def __str__(self):
     return f"{str(self.obj)}.{self.id}"
 
 class VariantExpr(Expr):
+  __slots__ = ("field", "variant")
 
   def __init__(self, f, t):
     Expr.__init__(self)
@@ -368,6 +454,7 @@ class VariantExpr(Expr):
     return f"<{str(self.field)}> as {str(self.type)}"
 
 class Case:
+  __slots__ = ("id", "var", "expr")
  
   def __init__(self, id, n, e):
     self.id = id 
@@ -378,6 +465,8 @@ class Case:
     return f"<{str(self.id)}={str(self.var)}> => {str(self.expr)}"
 
 class CaseExpr(Expr):
+  __slots__ = ("expr", "cases")
+
   def __init__(self, e, cs):
     Expr.__init__(self)
     self.expr = expr(e)
@@ -425,6 +514,6 @@ def case(x):
 
 from lookup import resolve
 from check import check
-from subst import subst
+from substitute import subst
 from reduce import step, reduce
 from evaluate import evaluate
@@ -0,0 +1,83 @@
+from lang import *
+from dispatch import Dispatch
+from evaluate import Closure, evaluate, evaluator
+from heap import tracer
+
+# Call-by-need.
+#
+# The "lazy" evaluator is the ordinary evaluator except that a call binds
+# each argument to a Thunk instead of its value. A thunk is evaluated the
+# first time a variable bound to it is looked up, and its value is kept, so
+# an argument is evaluated at most once, and not at all if the body never
+# uses it. `and` and `or` only evaluate their right operand when the left
+# one does not decide the result.
+#
+# Arguments are evaluated when first used rather than in order before the
+# call, so programs whose arguments allocate or assign may see their
+# effects happen later, or not at all.
+#
+#   Machine(evaluator = "lazy").run(e)
+
+lazy = Dispatch("lazy", evaluator)
+
+
+class Thunk:
+  # A delayed argument. Once forced, it drops its expression and
+  # environment so the collector can reclaim them.
+  __slots__ = ("expr", "env", "forced", "value")
+
+  def __init__(self, e, env):
+    self.expr = e
+    self.env = env
+    self.forced = False
+    self.value = None
+
+  def force(self, m):
+    if not self.forced:
+      self.value = evaluate(self.expr, self.env, m)
+      self.forced = True
+      self.expr = self.env = None
+    return self.value
+
+  def __str__(self):
+    return str(self.value) if self.forced else f"<thunk {self.expr}>"
+
+@tracer.register(Thunk)
+def trace_thunk(t):
+  return [t.value] if t.forced else [t.env]
+
+
+@lazy.register(IdExpr)
+def eval_id(e : Expr, stack, m):
+  v = stack.lookup(e)
+  if type(v) is Thunk:
+    return v.force(m)
+  return v
+
+@lazy.register(CallExpr)
+def eval_call(e : Expr, stack, m):
+  c = evaluate(e.fn, stack, m)
+
+  if type(c) is not Closure:
+    raise Exception("cannot apply a non-closure to an argument")
+
+  env = c.env.bind(c.abs.vars, [Thunk(a, stack) for a in e.args])
+  roots = m.heap.roots
+  roots.append(env)
+  v = evaluate(c.abs.expr, env, m)
+  roots.pop()
+  return v
+
+@lazy.register(AndExpr)
+def eval_and(e : Expr, stack, m):
+  v1 = evaluate(e.lhs, stack, m)
+  if not v1:
+    return v1
+  return evaluate(e.rhs, stack, m)
+
+@lazy.register(OrExpr)
+def eval_or(e : Expr, stack, m):
+  v1 = evaluate(e.lhs, stack, m)
+  if v1:
+    return v1
+  return evaluate(e.rhs, stack, m)
@@ -1,4 +1,7 @@
 from lang import *
+from dispatch import Dispatch
+
+resolver = Dispatch("resolve")
 
 @checked
 def lookup(id : str, stk : list):
@@ -8,149 +11,119 @@ def lookup(id : str, stk : list):
       return scope[id]
   return None
 
+@checked
+def depth(id : str, stk : list):
+  # How many scopes out from the innermost one id is declared.
+  for n, scope in enumerate(reversed(stk)):
+    if id in scope:
+      return n
+  return None
+
+@resolver.register(BoolExpr, IntExpr)
+@checked
+def resolve_literal(e : Expr, stk : list):
+  return e
+
+@resolver.register(NotExpr, NegExpr, NewExpr, DerefExpr)
 @checked
 def resolve_unary(e : Expr, stk : list):
   resolve(e.expr, stk)
   return e
 
+@resolver.register(
+  AndExpr, OrExpr,
+  AddExpr, SubExpr, MulExpr, DivExpr, RemExpr,
+  EqExpr, NeExpr, LtExpr, GtExpr, LeExpr, GeExpr,
+  AssignExpr)
 @checked
 def resolve_binary(e : Expr, stk : list):
   resolve(e.lhs, stk)
   resolve(e.rhs, stk)
   return e
 
+@resolver.register(IfExpr)
 @checked
-def resolve(e : Expr, stk : list = []):
- 
-  if type(e) is BoolExpr:
-    return e
-
-  if type(e) is AndExpr:
-    return resolve_binary(e, stk)
-
-  if type(e) is OrExpr:
-    return resolve_binary(e, stk)
-
-  if type(e) is NotExpr:
-    return resolve_unary(e, stk)
-
-  if type(e) is IfExpr:
-    resolve(e.cond, stk)
-    resolve(e.true, stk)
-    resolve(e.false, stk)
-    return e
-
-  # Arithmetic expressions
-
-  if type(e) is IntExpr:
-    return e
-
-  if type(e) is AddExpr:
-    return resolve_binary(e, stk)
-
-  if type(e) is SubExpr:
-    return resolve_binary(e, stk)
-
-  if type(e) is MulExpr:
-    return resolve_binary(e, stk)
-
-  if type(e) is DivExpr:
-    return resolve_binary(e, stk)
-
-  if type(e) is RemExpr:
-    return resolve_binary(e, stk)
-
-  if type(e) is NegExpr:
-    return resolve_unary(e, stk)
-
-  # Relational expressions
-
-  if type(e) is EqExpr:
-    return resolve_binary(e, stk)
-
-  if type(e) is NeExpr:
-    return resolve_binary(e, stk)
-
-  if type(e) is LtExpr:
-    return resolve_binary(e, stk)
-
-  if type(e) is GtExpr:
-    return resolve_binary(e, stk)
-
-  if type(e) is LeExpr:
-    return resolve_binary(e, stk)
-
-  if type(e) is GeExpr:
-    return resolve_binary(e, stk)
-
-  # Lambda expressions
-
-  if type(e) is IdExpr:
-    decl = lookup(e.id, stk)
-    if not decl:
-      raise Exception("name lookup error")
-
-    e.ref = decl
-    return e
-
-  if type(e) is LambdaExpr:
-  
-    newstk = stk + [{var.id:var for var in e.vars}]
-    resolve(e.expr, newstk)
-    return e
-
-  if type(e) is CallExpr:
-    resolve(e.fn, stk)
-    for a in e.args:
-      resolve(e.fn, stk)
-    return e
-
-  # Reference expressions
+def resolve_if(e : Expr, stk : list):
+  resolve(e.cond, stk)
+  resolve(e.true, stk)
+  resolve(e.false, stk)
+  return e
 
-  if type(e) is NewExpr:
-    return resolve_unary(e, stk)
+# Lambda expressions
 
-  if type(e) is DerefExpr:
-    return resolve_unary(e, stk)
+@resolver.register(IdExpr)
+@checked
+def resolve_id(e : Expr, stk : list):
+  decl = lookup(e.id, stk)
+  if not decl:
+    raise Exception("name lookup error")
+
+  e.ref = decl
+  e.depth = depth(e.id, stk)
+  e.slot = decl.slot
+  return e
 
-  if type(e) is AssignExpr:
-    return resolve_binary(e, stk)
+@resolver.register(LambdaExpr)
+@checked
+def resolve_lambda(e : Expr, stk : list):
 
-  # Data expressions
+  for i, var in enumerate(e.vars):
+    var.slot = i
+  newstk = stk + [{var.id:var for var in e.vars}]
+  resolve(e.expr, newstk)
+  return e
 
-  if type(e) is TupleExpr:
-    for x in e.elems:
-      resolve(x)
-    return e
+@resolver.register(CallExpr)
+@checked
+def resolve_call(e : Expr, stk : list):
+  resolve(e.fn, stk)
+  for a in e.args:
+    resolve(a, stk)
+  return e
 
-  if type(e) is ProjExpr:
-   
-    resolve(e.obj)
-    return e
+# Data expressions
 
-  if type(e) is RecordExpr:
-    for f in e.fields:
-      resolve(f.value)
-    return e
+@resolver.register(TupleExpr)
+@checked
+def resolve_tuple(e : Expr, stk : list):
+  for x in e.elems:
+    resolve(x, stk)
+  return e
 
-  if type(e) is MemberExpr:
-  
-    resolve(e.obj)
-    return e
+@resolver.register(ProjExpr, MemberExpr)
+@checked
+def resolve_access(e : Expr, stk : list):
+  resolve(e.obj, stk)
+  return e
 
-  if type(e) is VariantExpr:
+@resolver.register(RecordExpr)
+@checked
+def resolve_record(e : Expr, stk : list):
+  for f in e.fields:
+    resolve(f.value, stk)
+  return e
 
-    resolve(e.field.value)
-    return e
+@resolver.register(VariantExpr)
+@checked
+def resolve_variant(e : Expr, stk : list):
+  resolve(e.field.value, stk)
+  return e
 
-  if type(e) is CaseExpr:
-    resolve(e.expr)
-    for c in e.cases:
-      newstk = stk + [{c.var.id, c.var}]
-      resolve(c.expr, newstk)
-    return e
+@resolver.register(CaseExpr)
+@checked
+def resolve_case(e : Expr, stk : list):
+  resolve(e.expr, stk)
+  for c in e.cases:
+    c.var.slot = 0
+    newstk = stk + [{c.var.id:c.var}]
+    resolve(c.expr, newstk)
+  return e
 
+resolve_table = resolver.table
 
-  print(repr(e))
-  assert False
-  
+@checked
+def resolve(e : Expr, stk : list = []):
+  # Resolving again may bind names to other declarations, so the free
+  # variables cached by free_vars() are dropped.
+  e.free = None
+  return resolve_table[type(e)](e, stk)
@@ -0,0 +1,48 @@
+from dispatch import passes
+from env import Env
+from heap import Heap
+
+# An evaluation session.
+#
+# A Machine owns everything one evaluation mutates: its heap, the roots the
+# collector starts from, the handler table and the counters. The evaluator
+# threads it through every handler in place of a bare heap, so machines
+# share nothing and can run one per thread. reset() empties the heap and
+# counters in place, so one machine can be reused between requests.
+#
+#   m = Machine(threshold = 1024, limit = 1 << 20)
+#   v = m.run(e)
+#   m.reset()
+
+
+class Machine:
+
+  def __init__(self, threshold = None, limit = None, heap = None, evaluator = "evaluate", memo = None):
+    self.heap = heap if heap is not None else Heap(threshold, limit)
+    self.table = passes[evaluator].table
+    # The call cache of the "memo" evaluator, made on first use.
+    self.memo = memo
+    self.runs = 0
+
+  def run(self, e, stack = None):
+    if stack is None:
+      stack = Env()
+
+    roots = self.heap.roots
+    n = len(roots)
+    roots.append(stack)
+    try:
+      return self.table[type(e)](e, stack, self)
+    finally:
+      # Also drops roots left behind when an evaluation raises.
+      del roots[n:]
+      self.runs += 1
+
+  def reset(self):
+    self.heap.reset()
+    if self.memo is not None:
+      self.memo.clear()
+    self.runs = 0
+
+  def __str__(self):
+    return f"machine: {self.runs} runs; {self.heap}"
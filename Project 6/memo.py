@@ -0,0 +1,164 @@
+from lang import *
+from dispatch import Dispatch
+from evaluate import Closure, Tuple, Record, Variant, evaluate, evaluator
+from heap import Location
+from walk import nodes
+
+from collections import OrderedDict
+
+# Memoised calls.
+#
+# The "memo" evaluator is the ordinary evaluator except that a call to a
+# pure lambda looks its result up in a bounded table first, and on a hit
+# does not run the body again:
+#
+#   m = Machine(evaluator = "memo", memo = Memo(4096))
+#   v = m.run(e)
+#   print(m.memo)    # hits, misses, evictions
+#
+# A lambda is pure when its body contains no NewExpr, AssignExpr or
+# DerefExpr. That is not enough on its own, since the body may call
+# closures it was given or captured, so a call is only memoised when every
+# closure in its key is pure as well. The key is the lambda together with
+# the values of its free variables and its arguments. Closures are keyed
+# the same way, by their lambda and free values, so two closures built by
+# the same lambda in equal environments share entries.
+#
+# Locations are keyed by index. A pure function cannot read or write a cell,
+# so its result only depends on which cell it was given, and it is still
+# right if the collector frees that cell and reuses the index.
+
+memoizer = Dispatch("memo", evaluator)
+
+
+class Impure(Exception):
+  pass
+
+
+class Lambda:
+  # What the memo table needs to know about one lambda.
+
+  def __init__(self, abs):
+    bound = set(abs.vars)
+    refs = []
+    self.pure = True
+    for e in nodes(abs.expr):
+      t = type(e)
+      if t is NewExpr or t is AssignExpr or t is DerefExpr:
+        self.pure = False
+      elif t is IdExpr:
+        refs += [e.ref]
+      elif t is LambdaExpr:
+        bound.update(e.vars)
+      elif t is CaseExpr:
+        bound.update(c.var for c in e.cases)
+
+    # In first-use order, so the key of a closure does not depend on hashing.
+    self.free = list(dict.fromkeys(r for r in refs if r not in bound))
+
+
+class Memo:
+
+  def __init__(self, maxsize = 4096):
+    self.maxsize = maxsize
+    self.table = OrderedDict()
+    self.lambdas = {}
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.impure = 0
+
+  def analyse(self, abs):
+    info = self.lambdas.get(abs)
+    if info is None:
+      info = self.lambdas[abs] = Lambda(abs)
+    return info
+
+  def value_key(self, v):
+    t = type(v)
+    if t is bool or t is int or t is float:
+      # The type is part of the key, since True == 1 but they print apart.
+      return (t, v)
+    if v is None:
+      return None
+    if t is Closure:
+      info = self.analyse(v.abs)
+      if not info.pure:
+        raise Impure()
+      env = v.env
+      return (v.abs, tuple(self.value_key(env[var]) for var in info.free))
+    if t is Location:
+      return (t, v.index)
+    if t is Tuple:
+      return (t, tuple(self.value_key(x) for x in v.values))
+    if t is Record:
+      return (t, tuple((f.id, self.value_key(f.value)) for f in v.fields))
+    if t is Variant:
+      return (t, v.tag, self.value_key(v.value))
+    raise Impure()
+
+  def key(self, c, args):
+    # The key of calling c with args, or None if the call is not pure.
+    try:
+      return (self.value_key(c), tuple(self.value_key(a) for a in args))
+    except Impure:
+      self.impure += 1
+      return None
+
+  def get(self, k, default = None):
+    v = self.table.get(k, self)
+    if v is self:
+      self.misses += 1
+      return default
+    self.table.move_to_end(k)
+    self.hits += 1
+    return v
+
+  def put(self, k, v):
+    self.table[k] = v
+    if len(self.table) > self.maxsize:
+      self.table.popitem(last = False)
+      self.evictions += 1
+
+  def clear(self):
+    self.table.clear()
+    self.lambdas.clear()
+    self.hits = self.misses = self.evictions = self.impure = 0
+
+  def __str__(self):
+    return f"memo: {len(self.table)}/{self.maxsize} entries, {self.hits} hits, " \
+      f"{self.misses} misses, {self.evictions} evictions, {self.impure} impure calls"
+
+
+missing = object()
+
+@memoizer.register(CallExpr)
+def eval_call(e : Expr, stack, m):
+  c = evaluate(e.fn, stack, m)
+
+  if type(c) is not Closure:
+    raise Exception("cannot apply a non-closure to an argument")
+
+  roots = m.heap.roots
+  args = []
+  roots += [c, args]
+  for a in e.args:
+    args += [evaluate(a, stack, m)]
+
+  if m.memo is None:
+    m.memo = Memo()
+  k = m.memo.key(c, args)
+  if k is not None:
+    v = m.memo.get(k, missing)
+    if v is not missing:
+      del roots[-2:]
+      return v
+
+  env = c.env.bind(c.abs.vars, args)
+  roots[-2:] = [env]
+  v = evaluate(c.abs.expr, env, m)
+  roots.pop()
+
+  if k is not None:
+    m.memo.put(k, v)
+  return v
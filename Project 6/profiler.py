@@ -0,0 +1,186 @@
+from lang import *
+from dispatch import Table
+
+import time
+
+# A profiler for programs in the language.
+#
+# A Profiler wraps every handler of a machine's evaluation mode, and
+# records for each node class and for each lambda how often it ran, its
+# inclusive time (with everything it evaluated) and its exclusive time
+# (without the nodes, or the lambda bodies, it evaluated in turn). It also
+# counts the values each lambda allocated. A lambda is entered when its
+# body starts evaluating, and named by a number, in order of first
+# evaluation, and its printed form.
+#
+#   p = Profiler()
+#   v = p.run(e)
+#   print(p.report())
+#   json.dump(p.to_json(), f)
+#   f.write(p.collapsed())     # for flamegraph.pl and speedscope
+#
+# Time is measured around every node, so the profiled program runs a few
+# times slower than usual; the proportions are what matter.
+#
+# Lambdas are seen through the dispatch of their bodies, so modes that run
+# a body in a loop of their own instead are refused. The trampoline is one:
+# eval_tail evaluates a tail call's body in its own loop, without a frame
+# the profiler could wrap, so its time would land on the caller. Profile
+# such programs in evaluate mode, which gives the same counts.
+
+# The values allocated by each kind of node.
+allocations = {
+  NewExpr: "cell",
+  LambdaExpr: "Closure",
+  TupleExpr: "Tuple",
+  RecordExpr: "Record",
+  VariantExpr: "Variant",
+}
+
+
+# Modes that evaluate lambda bodies without going through the machine's
+# table: the trampoline loops straight into tail calls.
+unattributed = {"trampoline"}
+
+
+class Stats:
+  def __init__(self, name):
+    self.name = name
+    self.calls = 0
+    self.inclusive = 0.0
+    self.exclusive = 0.0
+    self.allocations = {}
+    # Activations in progress, so recursion adds to inclusive time once.
+    self.active = 0
+
+  def to_json(self):
+    return {
+      "name": self.name,
+      "calls": self.calls,
+      "inclusive": self.inclusive,
+      "exclusive": self.exclusive,
+      "allocations": dict(self.allocations),
+    }
+
+
+class Profiler:
+
+  def __init__(self, clock = time.perf_counter):
+    self.clock = clock
+    self.nodes = {}
+    self.lambdas = {}
+    self.program = Stats("<program>")
+    # LambdaExpr by body, filled in as lambdas are evaluated.
+    self.bodies = {}
+    # Exclusive time by stack of lambda names, outermost first.
+    self.stacks = {}
+    self.node_frames = []
+    self.lambda_frames = []
+
+  def lambda_stats(self, abs):
+    s = self.lambdas.get(abs)
+    if s is None:
+      name = f"#{len(self.lambdas) + 1} {str(abs)}".replace(";", ",")
+      if len(name) > 80:
+        name = name[:77] + "..."
+      s = self.lambdas[abs] = Stats(name)
+    return s
+
+  def enter(self, stats, frames, t0, path = None):
+    stats.calls += 1
+    stats.active += 1
+    frames.append([stats, t0, 0.0, path])
+
+  def leave(self, frames, t1):
+    stats, t0, child, path = frames.pop()
+    elapsed = t1 - t0
+    stats.exclusive += elapsed - child
+    stats.active -= 1
+    if not stats.active:
+      stats.inclusive += elapsed
+    if frames:
+      frames[-1][2] += elapsed
+    if path is not None:
+      self.stacks[path] = self.stacks.get(path, 0.0) + elapsed - child
+
+  def wrap(self, kind, fn):
+    stats = self.nodes.get(kind)
+    if stats is None:
+      stats = self.nodes[kind] = Stats(kind.__name__)
+    alloc = allocations.get(kind)
+    clock = self.clock
+    bodies = self.bodies
+    node_frames = self.node_frames
+    lambda_frames = self.lambda_frames
+    enter = self.enter
+    leave = self.leave
+
+    def run(e, stack, m):
+      abs = bodies.get(e)
+      t0 = clock()
+      if abs is not None:
+        path = lambda_frames[-1][3] + (self.lambda_stats(abs).name,)
+        enter(self.lambda_stats(abs), lambda_frames, t0, path)
+      enter(stats, node_frames, t0)
+
+      if alloc is not None:
+        a = lambda_frames[-1][0].allocations
+        a[alloc] = a.get(alloc, 0) + 1
+        if kind is LambdaExpr:
+          bodies[e.expr] = e
+
+      try:
+        return fn(e, stack, m)
+      finally:
+        t1 = clock()
+        leave(node_frames, t1)
+        if abs is not None:
+          leave(lambda_frames, t1)
+    return run
+
+  def run(self, e : Expr, m = None, stack = None):
+    # Evaluates e on m (a fresh Machine by default), in m's evaluation
+    # mode, under the profiler.
+    from machine import Machine
+    m = m or Machine()
+    table = m.table
+    if table.name in unattributed:
+      raise Exception(f"profile: cannot attribute lambda calls in {table.name} mode")
+    m.table = Table(f"profile {table.name}")
+    for kind, fn in table.items():
+      m.table[kind] = self.wrap(kind, fn)
+    self.enter(self.program, self.lambda_frames, self.clock(), (self.program.name,))
+    try:
+      return m.run(e, stack)
+    finally:
+      self.leave(self.lambda_frames, self.clock())
+      m.table = table
+
+  def to_json(self):
+    return {
+      "program": self.program.to_json(),
+      "lambdas": [s.to_json() for s in self.lambdas.values()],
+      "nodes": [s.to_json() for s in self.nodes.values() if s.calls],
+    }
+
+  def collapsed(self):
+    # One line per stack of lambdas: the names joined by ';', then the
+    # exclusive time in microseconds.
+    lines = []
+    for path, t in self.stacks.items():
+      lines += [f"{';'.join(path)} {round(t * 1e6)}"]
+    return "\n".join(lines) + "\n"
+
+  def report(self, top = 10):
+    def table(title, stats):
+      stats = sorted(stats, key = lambda s: s.exclusive, reverse = True)[:top]
+      out = [f"{title:<40} {'calls':>9} {'incl ms':>9} {'excl ms':>9}  allocations"]
+      for s in stats:
+        allocs = ",".join(f"{k}={n}" for k, n in s.allocations.items())
+        out += [f"{s.name[:40]:<40} {s.calls:>9} {s.inclusive * 1e3:>9.2f} {s.exclusive * 1e3:>9.2f}  {allocs}"]
+      return out
+
+    out = table("lambda", [self.program] + list(self.lambdas.values()))
+    out += [""]
+    out += table("node", [s for s in self.nodes.values() if s.calls])
+    return "\n".join(out)
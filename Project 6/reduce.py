@@ -1,11 +1,15 @@
 from lang import *
+from dispatch import Dispatch
+
+stepper = Dispatch("step")
 
 def is_value(e):
-  return type(e) in (BoolExpr, AbsExpr, LambdaExpr)
+  return type(e) in (BoolExpr, IntExpr, LambdaExpr)
 
 def is_reducible(e):
   return not is_value(e)
 
+@stepper.register(AndExpr)
 def step_and(e):
 
   if is_reducible(e.lhs):
@@ -14,8 +18,9 @@ def step_and(e):
   if is_reducible(e.rhs):
     return AndExpr(e.lhs, step(e.rhs))
 
-  return BoolExpr(e.lhs.val and e.rhs.val)
+  return BoolExpr(e.lhs.value and e.rhs.value)
 
+@stepper.register(OrExpr)
 def step_or(e):
  
   if is_reducible(e.lhs):
@@ -24,43 +29,29 @@ def step_or(e):
   if is_reducible(e.rhs):
     return OrExpr(e.lhs, step(e.rhs))
 
-  return BoolExpr(e.lhs.val or e.rhs.val)
+  return BoolExpr(e.lhs.value or e.rhs.value)
 
+@stepper.register(NotExpr)
 def step_not(e):
 
   if is_reducible(e.expr):
     return NotExpr(step(e.expr))
 
-  return BoolExpr(not e.expr.val)
+  return BoolExpr(not e.expr.value)
 
+@stepper.register(IfExpr)
 def step_if(e):
 
 
   if is_reducible(e.cond):
-    return NotExpr(step(e.cond), e.true, e.false)
+    return IfExpr(step(e.cond), e.true, e.false)
 
-  if e.cond.val:
+  if e.cond.value:
     return e.true
   else:
     return e.false
 
-def step_app(e):
- 
-  
-  if is_reducible(e.lhs): 
-    return AppExpr(step(e.lhs), e.rhs)
-
-  if type(e.lhs) is not AbsExpr:
-    raise Exception("application of non-lambda")
-
-  if is_reducible(e.rhs): 
-    return AppExpr(e.lhs, step(e.rhs))
-
-  s = {
-    e.lhs.var: e.rhs
-  }
-  return subst(e.lhs.expr, s);
-
+@stepper.register(CallExpr)
 def step_call(e):
  
   if is_reducible(e.fn):
@@ -81,33 +72,24 @@ def step_call(e):
 
   return subst(e.fn.expr, s);
 
+step_table = stepper.table
 
 def step(e):
   assert isinstance(e, Expr)
   assert is_reducible(e)
 
-  if type(e) is AndExpr:
-    return step_and(e)
-
-  if type(e) is OrExpr:
-    return step_or(e)
-
-  if type(e) is NotExpr:
-    return step_not(e)
-
-  if type(e) is IfExpr:
-    return step_if(e)
-
-  if type(e) is AppExpr:
-    return step_app(e)
-
-  if type(e) is CallExpr:
-    return step_call(e)
-
-  assert False
+  return step_table[type(e)](e)
 
-def reduce(e):
+def reduce_iter(e):
+  # Each term of the reduction of e, after every step, as it is reached.
   while not is_value(e):
     e = step(e)
-    print(e)
+    yield e
+
+def reduce(e, sink = None):
+  # The value of e. sink, if given, is called with every intermediate
+  # term; see sinks.py. Nothing is formatted unless the sink does it.
+  for e in reduce_iter(e):
+    if sink is not None:
+      sink(e)
   return e
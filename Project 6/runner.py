@@ -0,0 +1,168 @@
+from lang import *
+from dispatch import passes
+from machine import Machine
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+import importlib
+import itertools
+import os
+import pickle
+
+# Running many independent programs.
+#
+# run_many(programs, workers = N) takes an iterable of unresolved Expr trees,
+# or the path of a file written by save_programs(), and runs
+# resolve -> check -> evaluate on each one in a pool of N processes. It is
+# a generator: results come back as their chunk completes, not in input
+# order, each as a Result carrying the program's index in the input.
+#
+#   for r in run_many(programs, workers = 32):
+#     print(r.index, r.error or r.value)
+#
+# Programs are sent in chunks of `chunksize` so that pickling and process
+# round trips are paid once per chunk, and at most two chunks per worker
+# are in flight so a large input is never all in memory. A program that
+# fails yields a Result with `error` set; it does not stop the run. Nor
+# does a worker process dying: the chunks in flight are run again one
+# program at a time, only the program that kills its worker is reported
+# as failed, and the rest of the input goes to a new pool.
+#
+# Each worker process keeps one Machine (reset between programs) and, for
+# mode = "codegen", the code cache, so both stay warm across chunks.
+
+
+class Result:
+  def __init__(self, index, value = None, error = None):
+    self.index = index
+    self.value = value
+    self.error = error
+
+  def __str__(self):
+    return f"{self.index}: {self.error if self.error else self.value}"
+
+
+def save_programs(path, programs):
+  # Writes programs as a stream of pickles, one per program.
+  with open(path, "wb") as f:
+    for e in programs:
+      pickle.dump(e, f, pickle.HIGHEST_PROTOCOL)
+
+def load_programs(path):
+  with open(path, "rb") as f:
+    while True:
+      try:
+        yield pickle.load(f)
+      except EOFError:
+        return
+
+
+# What run_many can run programs with: the evaluation modes, each defined
+# by the module of the same name, and generated code.
+modes = ("evaluate", "trampoline", "lazy", "memo", "codegen")
+
+# Per-process state, set up once by start_worker().
+worker = None
+
+class Worker:
+  def __init__(self, mode):
+    if mode != "codegen" and mode not in passes:
+      importlib.import_module(mode)
+    self.mode = mode
+    self.machine = Machine(evaluator = mode if mode != "codegen" else "evaluate")
+    if mode == "codegen":
+      from codegen import codegen
+      from heap import Heap
+      from env import Env
+      self.run = lambda e: codegen(e)(Env(), Heap())
+    else:
+      self.run = self.machine.run
+
+  def execute(self, i, e):
+    try:
+      e = resolve(e)
+      check(e)
+      v = self.run(e)
+    except Exception as x:
+      return Result(i, error = f"{type(x).__name__}: {x}")
+    finally:
+      self.machine.reset()
+
+    # Heap locations and closures mean nothing outside this process.
+    if v is not None and type(v) not in (bool, int, float):
+      v = str(v)
+    return Result(i, v)
+
+def start_worker(mode):
+  global worker
+  worker = Worker(mode)
+
+def run_chunk(chunk):
+  return [worker.execute(i, e) for i, e in chunk]
+
+
+def chunks(programs, size):
+  it = enumerate(programs)
+  while True:
+    chunk = list(itertools.islice(it, size))
+    if not chunk:
+      return
+    yield chunk
+
+def run_pool(todo, workers, mode, flight):
+  # Runs the chunks of todo with at most `flight` in flight, yielding their
+  # results. If a worker dies the pool cannot go on, and the chunks that
+  # were in flight are returned; otherwise nothing is.
+  with ProcessPoolExecutor(workers, initializer = start_worker, initargs = (mode,)) as pool:
+    pending = {}
+    for chunk in itertools.islice(todo, flight):
+      pending[pool.submit(run_chunk, chunk)] = chunk
+
+    while pending:
+      done, _ = wait(pending, return_when = FIRST_COMPLETED)
+      for f in done:
+        chunk = pending.pop(f)
+        try:
+          results = f.result()
+        except BrokenProcessPool:
+          return [chunk] + list(pending.values())
+        except Exception as x:
+          results = [Result(i, error = f"{type(x).__name__}: {x}") for i, _ in chunk]
+        yield from results
+        chunk = next(todo, None)
+        if chunk is not None:
+          pending[pool.submit(run_chunk, chunk)] = chunk
+  return []
+
+def isolate(lost, mode):
+  # Runs the programs of chunks lost with a pool one at a time, in a pool
+  # of one, so that a dead worker points at the program it was running.
+  todo = ([p] for chunk in lost for p in chunk)
+  while True:
+    dead = yield from run_pool(todo, 1, mode, 1)
+    if not dead:
+      return
+    for i, _ in dead[0]:
+      yield Result(i, error = "BrokenProcessPool: the worker running this program died")
+
+def run_many(programs, workers = None, chunksize = 64, mode = "evaluate"):
+  if mode not in modes:
+    raise ValueError(f"run_many: unsupported mode {mode!r}; the modes are {', '.join(modes)}")
+  if isinstance(programs, (str, os.PathLike)):
+    programs = load_programs(programs)
+  workers = workers or os.cpu_count() or 1
+
+  if workers == 1:
+    # No pool: run in this process, still one chunk at a time.
+    local = Worker(mode)
+    for chunk in chunks(programs, chunksize):
+      for i, e in chunk:
+        yield local.execute(i, e)
+    return
+
+  todo = chunks(programs, chunksize)
+  while True:
+    lost = yield from run_pool(todo, workers, mode, 2 * workers)
+    if not lost:
+      return
+    yield from isolate(lost, mode)
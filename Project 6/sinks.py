@@ -0,0 +1,105 @@
+import collections
+import os
+
+# Sinks for reduction traces.
+#
+# reduce(e, sink) calls sink(term) after every step. A sink decides what,
+# if anything, to keep, so a long reduction only pays for formatting the
+# terms it actually records:
+#
+#   reduce(e, Count())                 # just the number of steps
+#   reduce(e, Sample(1000, Print()))   # print every 1000th term
+#   reduce(e, Ring(50))                # keep the last 50 terms
+#   with DiffFile("trace.txt") as d:   # every term, as compact diffs
+#     reduce(e, d)
+#
+# Sinks that hold resources are context managers and have close().
+
+
+class Count:
+  def __init__(self):
+    self.steps = 0
+
+  def __call__(self, e):
+    self.steps += 1
+
+
+class Print:
+  # What reduce() used to do: print every term.
+  def __init__(self, file = None):
+    self.file = file
+
+  def __call__(self, e):
+    print(e, file = self.file)
+
+
+class Sample:
+  # Passes every nth term on to another sink.
+  def __init__(self, n, sink):
+    self.n = n
+    self.sink = sink
+    self.steps = 0
+
+  def __call__(self, e):
+    self.steps += 1
+    if self.steps % self.n == 0:
+      self.sink(e)
+
+
+class Ring:
+  # The last `size` terms, unformatted, with their step numbers.
+  def __init__(self, size):
+    self.terms = collections.deque(maxlen = size)
+    self.steps = 0
+
+  def __call__(self, e):
+    self.steps += 1
+    self.terms.append((self.steps, e))
+
+  def __iter__(self):
+    return iter(self.terms)
+
+
+class DiffFile:
+  # Writes every term as its difference from the one before: one line
+  #
+  #   <prefix> <suffix> <middle>
+  #
+  # meaning the first <prefix> and last <suffix> characters of the previous
+  # term, with <middle> between them. A small step in a big term is then a
+  # short line. read_diffs() turns the file back into terms.
+
+  def __init__(self, path):
+    self.file = open(path, "w")
+    self.last = ""
+
+  def __call__(self, e):
+    s = str(e)
+    last = self.last
+    p = len(os.path.commonprefix([last, s]))
+    n = min(len(last), len(s)) - p
+    q = 0
+    while q < n and last[-1 - q] == s[-1 - q]:
+      q += 1
+    self.file.write(f"{p} {q} {s[p:len(s) - q]}\n")
+    self.last = s
+
+  def close(self):
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def read_diffs(path):
+  # The printed terms written by a DiffFile, in order.
+  last = ""
+  with open(path) as f:
+    for line in f:
+      p, q, middle = line[:-1].split(" ", 2)
+      p, q = int(p), int(q)
+      last = last[:p] + middle + last[len(last) - q:]
+      yield last
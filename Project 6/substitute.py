@@ -1,53 +1,133 @@
 from lang import *
+from dispatch import Dispatch
+from walk import children, walker
 
-def subst(e, s):
+substituter = Dispatch("subst")
 
-  if type(e) is BoolExpr:
-    return e
+# Free variables.
+#
+# free_vars(e) is the frozenset of resolved VarDecls that occur free in e.
+# It is computed once per node and kept in e.free. resolve() rebinds names
+# in place, so it clears e.free on every node it visits. subst() uses it to
+# return a subtree as it is when none of the substituted variables occur
+# in it, so a beta step only rebuilds the nodes on the paths to the
+# occurrences of its parameters, and the rest of the body is shared.
+
+freevars = Dispatch("free")
+
+none = frozenset()
+
+@freevars.register(*walker.table)
+def free_children(e):
+  # Shares a child's set where it can, rather than building equal copies.
+  fv = none
+  for x in children(e):
+    f = free_vars(x)
+    if f and not f <= fv:
+      fv = f if not fv else fv | f
+  return fv
+
+@freevars.register(
+  AndExpr, OrExpr,
+  AddExpr, SubExpr, MulExpr, DivExpr, RemExpr,
+  EqExpr, NeExpr, LtExpr, GtExpr, LeExpr, GeExpr,
+  AssignExpr)
+def free_binary(e):
+  f1 = free_vars(e.lhs)
+  f2 = free_vars(e.rhs)
+  if f2 <= f1:
+    return f1
+  if f1 <= f2:
+    return f2
+  return f1 | f2
+
+@freevars.register(NotExpr, NegExpr, NewExpr, DerefExpr)
+def free_unary(e):
+  return free_vars(e.expr)
+
+@freevars.register(BoolExpr, IntExpr)
+def free_literal(e):
+  return none
 
-  if type(e) is AndExpr:
-    e1 = subst(e.lhs, s)
-    e2 = subst(e.rhs, s)
-    return AndExpr(e1, e2)
+@freevars.register(IdExpr)
+def free_id(e):
+  return frozenset((e.ref,))
 
-  if type(e) is OrExpr:
-    e1 = subst(e.lhs, s)
-    e2 = subst(e.rhs, s)
-    return OrExpr(e1, e2)
+@freevars.register(LambdaExpr)
+def free_lambda(e):
+  fv = free_vars(e.expr)
+  if fv.isdisjoint(e.vars):
+    return fv
+  return fv.difference(e.vars)
 
-  if type(e) is NotExpr:
-    e1 = subst(e.expr, s)
-    return NotExpr(e1)
+@freevars.register(CaseExpr)
+def free_case(e):
+  fv = free_vars(e.expr)
+  for c in e.cases:
+    f = free_vars(c.expr)
+    if c.var in f:
+      f = f.difference((c.var,))
+    if f and not f <= fv:
+      fv = f if not fv else fv | f
+  return fv
 
-  if type(e) is IfExpr:
-    e1 = subst(e.cond, s)
-    e2 = subst(e.true, s)
-    e3 = subst(e.false, s)
-    return IfExpr(e1, e2, e3)
+free_table = freevars.table
 
-  if type(e) is IdExpr:
-    if e.ref in s:
-      return s[e.ref]
-    else:
-      return e
+def free_vars(e):
+  fv = e.free
+  if fv is None:
+    fv = e.free = free_table[type(e)](e)
+  return fv
 
-  if type(e) is AbsExpr:
+@substituter.register(BoolExpr, IntExpr)
+def subst_literal(e, s):
+  return e
 
-    e1 = subst(e.expr, s)
-    return AbsExpr(e.var, e1)
+@substituter.register(AndExpr)
+def subst_and(e, s):
+  e1 = subst(e.lhs, s)
+  e2 = subst(e.rhs, s)
+  return AndExpr(e1, e2)
 
-  if type(e) is AppExpr:
-    e1 = subst(e.lhs, s)
-    e2 = subst(e.rhs, s)
-    return AppExpr(e1, e2)
+@substituter.register(OrExpr)
+def subst_or(e, s):
+  e1 = subst(e.lhs, s)
+  e2 = subst(e.rhs, s)
+  return OrExpr(e1, e2)
 
-  if type(e) is LambdaExpr:
-    e1 = subst(e.expr, s)
-    return LambdaExpr(e.vars, e1)
+@substituter.register(NotExpr)
+def subst_not(e, s):
+  e1 = subst(e.expr, s)
+  return NotExpr(e1)
 
-  if type(e) is CallExpr:
-    e0 = subst(e.fn, s)
-    args = list(map(lambda x: subst(x, s), e.args))
-    return CallExpr(e0, args)
+@substituter.register(IfExpr)
+def subst_if(e, s):
+  e1 = subst(e.cond, s)
+  e2 = subst(e.true, s)
+  e3 = subst(e.false, s)
+  return IfExpr(e1, e2, e3)
 
-  assert False
+@substituter.register(IdExpr)
+def subst_id(e, s):
+  if e.ref in s:
+    return s[e.ref]
+  else:
+    return e
+
+@substituter.register(LambdaExpr)
+def subst_lambda(e, s):
+  e1 = subst(e.expr, s)
+  return LambdaExpr(e.vars, e1)
+
+@substituter.register(CallExpr)
+def subst_call(e, s):
+  e0 = subst(e.fn, s)
+  args = list(map(lambda x: subst(x, s), e.args))
+  return CallExpr(e0, args)
+
+subst_table = substituter.table
+
+def subst(e, s):
+  if s.keys().isdisjoint(free_vars(e)):
+    return e
+  return subst_table[type(e)](e, s)
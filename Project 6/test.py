@@ -1,5 +1,24 @@
 from lang import *
+from compiler import compile
+from codegen import codegen, CodeCache, marker
+from columnar import evaluate_batch, np
+from heap import Heap
+from machine import Machine
+import trampoline
+import lazy
+import memo
+from profiler import Profiler
+from zipper import terms
+from explicit import reduce_explicit
+from graph import reduce_graph
+from parallel import reduce_parallel
+from reduce import step
+from cek import CEK, evaluate_cek
+from runner import run_many
+from env import Env, Frame
 import copy
+import os
+import tempfile
 
 clone = copy.deepcopy
 
@@ -71,3 +90,163 @@ check(e10)
 print(f"* expr:  {e10}")
 print(f"* value: {evaluate(e10)}")
 
+
+print("---- compiled ----")
+for e in [e1, e2, e3, e4, e6, e7, e8, e10]:
+  v1 = evaluate(e)
+  v2 = compile(e)(Env(), Heap())
+  v3 = evaluate(e, Frame(), Machine())
+  v4 = Machine(evaluator = "trampoline").run(e)
+  v5 = evaluate_cek(e)
+  v6 = Machine(evaluator = "lazy").run(e)
+  v7 = Machine(evaluator = "memo").run(e)
+  assert str(v1) == str(v2) == str(v3) == str(v4) == str(v5) == str(v6) == str(v7)
+  print(f"* value: {v2}")
+
+
+print("---- cek ----")
+k = CEK(e10)
+while not k.run(steps = 1):
+  pass
+assert str(k.value) == str(evaluate(e10))
+print(f"* value: {k.value} after {k.steps} steps")
+
+print("---- lazy ----")
+# The unused argument would divide by zero if it were evaluated.
+e11 = resolve(CallExpr(LambdaExpr([VarDecl("x", int), VarDecl("y", int)], AddExpr("y", "y")),
+  [DivExpr(1, 0), 21]))
+check(e11)
+print(f"* expr:  {e11}")
+print(f"* value: {Machine(evaluator = 'lazy').run(e11)}")
+
+print("---- profile ----")
+p = Profiler()
+print(f"* value: {p.run(e11, Machine(evaluator = 'lazy'))}")
+for s in p.lambdas.values():
+  print(f"* {s.name}: {s.calls} calls")
+refused = False
+try:
+  Profiler().run(e11, Machine(evaluator = 'trampoline'))
+except Exception as x:
+  refused = True
+  print(f"* trampoline: {x}")
+assert refused
+
+print("---- zipper ----")
+e12 = resolve(CallExpr(LambdaExpr([VarDecl("p", bool), VarDecl("q", bool)], OrExpr(NotExpr("p"), "q")),
+  [AndExpr(True, False), NotExpr(False)]))
+x = e12
+for t in terms(e12):
+  x = step(x)
+  assert str(t) == str(x)
+  print(f"* {t}")
+
+# Resolving a body again under a new binder must not keep the free
+# variables computed for the old one.
+body = NotExpr("x")
+assert str(reduce(CallExpr(resolve(LambdaExpr([VarDecl("x", bool)], body)), [True]))) == "false"
+assert str(reduce(CallExpr(resolve(LambdaExpr([VarDecl("x", bool)], body)), [True]))) == "false"
+
+print("---- explicit ----")
+e13 = resolve(CallExpr(LambdaExpr([VarDecl("p", bool)],
+  IfExpr("p", LambdaExpr([VarDecl("q", bool)], AndExpr("p", "q")), NotExpr("p"))), [NotExpr(False)]))
+v, stats = reduce_explicit(e13)
+assert str(v) == str(reduce(e13))
+print(f"* {v}: {stats}")
+
+print("---- graph ----")
+e14 = resolve(CallExpr(LambdaExpr([VarDecl("f", bool)], LambdaExpr([VarDecl("x", bool)],
+  AndExpr(CallExpr("f", ["x"]), CallExpr("f", ["x"])))), [LambdaExpr([VarDecl("y", bool)], NotExpr(NotExpr("y")))]))
+print(f"* whnf: {reduce_graph(e14, normal = False)}")
+print(f"* normal: {reduce_graph(e14)}")
+e15 = resolve(CallExpr(LambdaExpr([VarDecl("f", bool)], CallExpr("f", ["f"])),
+  [LambdaExpr([VarDecl("x", bool)], LambdaExpr([VarDecl("y", bool)], CallExpr("x", ["y"])))]))
+v = reduce_graph(e15).value
+assert v.vars[0] is not v.expr.vars[0]
+assert v.expr.expr.fn.ref is v.vars[0] and v.expr.expr.args[0].ref is v.expr.vars[0]
+print(f"* normal: {v}")
+
+print("---- parallel ----")
+v, covered = reduce_parallel(e12, lambda t: print(f"* {t}"))
+assert str(v) == str(reduce(e12))
+print(f"* {len(covered)} parallel steps covering {covered}")
+
+print("---- collection ----")
+# Collecting on every allocation: only the first location is still
+# reachable when it is read.
+e16 = resolve(DerefExpr(ProjExpr(TupleExpr([NewExpr(10), NewExpr(20), NewExpr(30)]), 0)))
+check(e16)
+vs = [Machine(threshold = 1, evaluator = mode).run(e16) for mode in ("evaluate", "trampoline", "lazy", "memo")]
+vs += [evaluate_cek(e16, m = Machine(threshold = 1))]
+vs += [compile(e16)(Env(), Heap(threshold = 1))]
+vs += [codegen(e16, cache = False)(Env(), Heap(threshold = 1))]
+assert vs == [10] * len(vs), vs
+print(f"* value: {vs[0]}")
+
+# A CEK machine paused holding the first location, while another run on
+# the same heap collects and allocates.
+m = Machine(threshold = 1)
+k = CEK(e16, m = m)
+while m.heap.live() == 0:
+  k.run(steps = 1)
+assert m.run(resolve(DerefExpr(NewExpr(99)))) == 99
+assert m.heap.stats.collections > 0
+k.run()
+assert k.value == 10 and not m.heap.roots
+print(f"* paused cek: {k.value}")
+
+# A closure made by generated code, kept in a cell of a heap that then
+# collects, keeps what it captured alive.
+e18 = resolve(CallExpr(LambdaExpr([VarDecl("r", RefType(int))],
+  NewExpr(LambdaExpr([VarDecl("u", int)], DerefExpr("r")))), [NewExpr(5)]))
+check(e18)
+heap = Heap()
+l = codegen(e18, cache = False)(Env(), heap)
+heap.roots.append(l)
+heap.collect()
+assert heap.live() == 2
+print(f"* codegen closure: {heap.live()} cells live")
+
+print("---- columnar ----")
+# x*x overflows int64 in the last row; that column falls back to exact ints.
+e17 = resolve(LambdaExpr([VarDecl("x", int)], AddExpr(MulExpr("x", "x"), 1)))
+check(e17)
+xs = [3, -(1 << 31), 1 << 40]
+if np is not None:
+  vs = evaluate_batch(e17, [np.array(xs)])
+  for x, v in zip(xs, vs):
+    assert v == evaluate(resolve(CallExpr(e17, [x])))
+  print(f"* values: {list(vs)}")
+
+print("---- code cache ----")
+# Only version directories the cache made itself are removed.
+with tempfile.TemporaryDirectory() as root:
+  for d in ("data", "0123456789abcdef", "fedcba9876543210"):
+    os.makedirs(os.path.join(root, d))
+  open(os.path.join(root, "fedcba9876543210", marker), "w").close()
+  cache = CodeCache(root)
+  left = sorted(os.listdir(root))
+  assert left == sorted(["data", "0123456789abcdef", cache.version]), left
+  print(f"* kept: {', '.join(d for d in left if d != cache.version)}")
+
+  # Entries someone else could have written are not loaded.
+  cache.put("k", (lambda: 1).__code__)
+  cache.memory.clear()
+  assert cache.get("k") is not None
+  os.chmod(os.path.join(cache.dir, "k.code"), 0o666)
+  cache.memory.clear()
+  assert cache.get("k") is None
+  os.chmod(os.path.join(cache.dir, "k.code"), 0o600)
+  os.chmod(cache.dir, 0o777)
+  assert cache.get("k") is None
+  print(f"* {cache.hits} hit, {cache.misses} misses")
+
+print("---- runner ----")
+refused = False
+try:
+  run_many([e1], workers = 2, mode = "cek").send(None)
+except ValueError as x:
+  refused = True
+  print(f"* {x}")
+assert refused
+print(f"* {[str(r) for r in run_many([AddExpr(1, 2), AddExpr(True, 1)], workers = 1)]}")
@@ -0,0 +1,68 @@
+from lang import *
+from dispatch import Dispatch
+from evaluate import Closure, evaluate, evaluator
+
+# Proper tail calls.
+#
+# The "trampoline" evaluator is the ordinary evaluator with one change: the
+# nodes that have a subexpression in tail position (CallExpr, IfExpr and
+# CaseExpr) are all handled by eval_tail, which evaluates a tail expression
+# by looping instead of recursing. The body of a called lambda, the chosen
+# branch of an if and the chosen arm of a case replace the current
+# expression and environment, and the loop goes round again, so a chain of
+# tail calls runs in one Python frame however long it is. Everything that
+# is not in tail position is evaluated by the usual handlers.
+#
+#   Machine(evaluator = "trampoline").run(e)
+
+trampoline = Dispatch("trampoline", evaluator)
+
+@trampoline.register(CallExpr, IfExpr, CaseExpr)
+def eval_tail(e : Expr, stack, m):
+  table = m.table
+  roots = m.heap.roots
+  n = len(roots)
+
+  # One root slot for the environment of the current iteration.
+  roots.append(stack)
+  while True:
+    t = type(e)
+
+    if t is CallExpr:
+      c = evaluate(e.fn, stack, m)
+      if type(c) is not Closure:
+        raise Exception("cannot apply a non-closure to an argument")
+
+      args = []
+      roots += [c, args]
+      for a in e.args:
+        args += [evaluate(a, stack, m)]
+      del roots[-2:]
+
+      stack = c.env.bind(c.abs.vars, args)
+      e = c.abs.expr
+
+    elif t is IfExpr:
+      if evaluate(e.cond, stack, m):
+        e = e.true
+      else:
+        e = e.false
+
+    elif t is CaseExpr:
+      v1 = evaluate(e.expr, stack, m)
+      case = None
+      for c in e.cases:
+        if c.id == v1.tag:
+          case = c
+          break
+      assert case != None
+
+      stack = stack.bind((case.var,), [v1.value])
+      e = case.expr
+
+    else:
+      v = table[t](e, stack, m)
+      del roots[n:]
+      return v
+
+    roots[n] = stack
@@ -0,0 +1,72 @@
+from lang import *
+from dispatch import Dispatch
+
+# Generic traversal.
+#
+# children(e) lists the immediate subexpressions of e, in evaluation
+# order, so an analysis that only cares about a few node kinds can visit
+# the rest without a handler for each. nodes(e) yields every node of e
+# with an explicit stack, so it also works on trees too deep to recurse on.
+
+walker = Dispatch("children")
+
+@walker.register(BoolExpr, IntExpr, IdExpr)
+def children_leaf(e):
+  return []
+
+@walker.register(NotExpr, NegExpr, NewExpr, DerefExpr, LambdaExpr)
+def children_unary(e):
+  return [e.expr]
+
+@walker.register(
+  AndExpr, OrExpr,
+  AddExpr, SubExpr, MulExpr, DivExpr, RemExpr,
+  EqExpr, NeExpr, LtExpr, GtExpr, LeExpr, GeExpr)
+def children_binary(e):
+  return [e.lhs, e.rhs]
+
+@walker.register(AssignExpr)
+def children_assign(e):
+  # The right-hand side is evaluated first.
+  return [e.rhs, e.lhs]
+
+@walker.register(IfExpr)
+def children_if(e):
+  return [e.cond, e.true, e.false]
+
+@walker.register(CallExpr)
+def children_call(e):
+  return [e.fn] + e.args
+
+@walker.register(TupleExpr)
+def children_tuple(e):
+  return e.elems
+
+@walker.register(ProjExpr, MemberExpr)
+def children_access(e):
+  return [e.obj]
+
+@walker.register(RecordExpr)
+def children_record(e):
+  return [f.value for f in e.fields]
+
+@walker.register(VariantExpr)
+def children_variant(e):
+  return [e.field.value]
+
+@walker.register(CaseExpr)
+def children_case(e):
+  return [e.expr] + [c.expr for c in e.cases]
+
+children_table = walker.table
+
+def children(e : Expr):
+  return children_table[type(e)](e)
+
+def nodes(e : Expr):
+  # Every node of e, parents before children.
+  todo = [e]
+  while todo:
+    e = todo.pop()
+    yield e
+    todo += reversed(children_table[type(e)](e))
@@ -0,0 +1,136 @@
+from lang import *
+from dispatch import Dispatch
+from reduce import is_value, is_reducible, step
+
+# A focused small-step reducer.
+#
+# reduce() calls step() on the whole term, which walks down to the redex
+# and rebuilds every node on the way back up, so each step costs the depth
+# of the redex. A Zipper keeps the term split into the subterm in focus and
+# the path of parents above it, with the child each was entered by. A step
+# contracts the redex in focus; the parents are only rebuilt when the focus
+# moves up past them, once each child is a value. Each step then touches
+# the redex and the few nodes around it, and the whole term is only put
+# back together when term() asks for it.
+#
+# The redex is found and contracted by the same rules as step(), so the
+# terms are the same ones reduce_iter() yields:
+#
+#   for t in terms(e):
+#     print(t)
+#
+# Only the node kinds step() handles can be reduced.
+
+plugger = Dispatch("plug")
+
+@plugger.register(AndExpr, OrExpr)
+def plug_binary(e, i, x):
+  if i == 0:
+    return type(e)(x, e.rhs)
+  return type(e)(e.lhs, x)
+
+@plugger.register(NotExpr)
+def plug_not(e, i, x):
+  return NotExpr(x)
+
+@plugger.register(IfExpr)
+def plug_if(e, i, x):
+  return IfExpr(x, e.true, e.false)
+
+@plugger.register(CallExpr)
+def plug_call(e, i, x):
+  if i == 0:
+    return CallExpr(x, e.args)
+  return CallExpr(e.fn, e.args[:i - 1] + [x] + e.args[i:])
+
+plug_table = plugger.table
+
+def plug(e, i, x):
+  # e with its child number i replaced by x.
+  return plug_table[type(e)](e, i, x)
+
+
+def child(e):
+  # The child of e that holds the next redex, as (index, child), or None
+  # when e itself is the redex. Mirrors the search order of step().
+  t = type(e)
+  if t is AndExpr or t is OrExpr:
+    if is_reducible(e.lhs):
+      return 0, e.lhs
+    if is_reducible(e.rhs):
+      return 1, e.rhs
+    return None
+  if t is NotExpr:
+    if is_reducible(e.expr):
+      return 0, e.expr
+    return None
+  if t is IfExpr:
+    if is_reducible(e.cond):
+      return 0, e.cond
+    return None
+  if t is CallExpr:
+    if is_reducible(e.fn):
+      return 0, e.fn
+    if len(e.args) < len(e.fn.vars):
+      raise Exception("too few arguments")
+    if len(e.args) > len(e.fn.vars):
+      raise Exception("too many arguments")
+    for i, a in enumerate(e.args):
+      if is_reducible(a):
+        return i + 1, a
+    return None
+  # No rule: let step() report it.
+  return None
+
+
+class Zipper:
+
+  def __init__(self, e : Expr):
+    self.focus = e
+    self.path = []
+    self.steps = 0
+
+  def done(self):
+    return not self.path and is_value(self.focus)
+
+  def step(self):
+    path = self.path
+    e = self.focus
+
+    # Move up past finished subterms, then down to the redex.
+    while is_value(e):
+      if not path:
+        raise Exception("cannot step a value")
+      parent, i = path.pop()
+      e = plug(parent, i, e)
+    while True:
+      c = child(e)
+      if c is None:
+        break
+      path.append((e, c[0]))
+      e = c[1]
+
+    self.focus = step(e)
+    self.steps += 1
+
+  def term(self):
+    # The whole current term, rebuilt along the path.
+    e = self.focus
+    for parent, i in reversed(self.path):
+      e = plug(parent, i, e)
+    return e
+
+
+def terms(e : Expr):
+  # The terms reduce_iter(e) yields, one per step.
+  z = Zipper(e)
+  while not z.done():
+    z.step()
+    yield z.term()
+
+def reduce_focused(e : Expr):
+  # The value of e, without building any intermediate term.
+  z = Zipper(e)
+  while not z.done():
+    z.step()
+  return z.focus
@@ -5,17 +5,23 @@ class Type:
   #       Int                      -- type of ints
   #       T1 -> T2                 -- type of abstractions
   #       (T1, T2, ..., Tn) -> T0  -- type of lambdas
-  pass
+  __slots__ = ()
 
 class BoolType(Type):
+  __slots__ = ()
+
   def __str__(self):
     return "Bool"
 
 class IntType(Type):
+  __slots__ = ()
+
   def __str__(self):
     return "Int"
 
 class ArrowType(Type):
+  __slots__ = ("parm", "ret")
+
   def __init__(self, t1, t2):
     self.parm = t1
     self.ret = t2
@@ -24,6 +30,8 @@ class ArrowType(Type):
     return f"({self.lhs} -> {self.rhs}"
 
 class FnType(Type):
+  __slots__ = ("parms", "ret")
+
   def __init__(self, parms, ret):
     self.parms = parms
     self.ret = ret
@@ -34,10 +42,11 @@ intType = IntType()
 
 
 class Expr:
-
-  pass
+  __slots__ = ()
 
 class BoolExpr(Expr):
+  __slots__ = ("val",)
+
   def __init__(self, val):
     self.val = val
 
@@ -45,6 +54,8 @@ class BoolExpr(Expr):
     return "true" if self.val else "false"
 
 class AndExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, e1, e2):
     self.lhs = expr(e1)
     self.rhs = expr(e2)
@@ -53,6 +64,8 @@ class AndExpr(Expr):
     return f"({self.lhs} and {self.rhs})"
 
 class OrExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, e1, e2):
     self.lhs = expr(e1)
     self.rhs = expr(e2)
@@ -61,6 +74,8 @@ class OrExpr(Expr):
     return f"({self.lhs} or {self.rhs})"
 
 class NotExpr(Expr):
+  __slots__ = ("expr",)
+
   def __init__(self, e1):
     self.expr = expr(e1)
 
@@ -68,6 +83,8 @@ class NotExpr(Expr):
     return f"(not {self.expr})"
 
 class IfExpr(Expr):
+  __slots__ = ("cond", "true", "false")
+
   def __init__(self, e1, e2, e3):
     self.cond = expr(e1)
     self.true = expr(e2)
@@ -77,6 +94,8 @@ class IfExpr(Expr):
     return f"(if {self.cond} then {self.true} else {self.false})"
 
 class IdExpr(Expr):
+  __slots__ = ("id", "ref")
+
   def __init__(self, x):
     if type(x) is str:
       self.id = x
@@ -89,6 +108,8 @@ class IdExpr(Expr):
     return self.id
 
 class VarDecl:
+  __slots__ = ("id", "type")
+
   def __init__(self, id, t):
     self.id = id
     self.type = t
@@ -97,6 +118,8 @@ class VarDecl:
     return self.id
 
 class AbsExpr(Expr):
+  __slots__ = ("var", "expr")
+
   def __init__(self, var, e1):
     self.var = decl(var)
     self.expr = expr(e1)
@@ -105,6 +128,8 @@ class AbsExpr(Expr):
     return f"\\{self.var}.{self.expr}"
 
 class AppExpr(Expr):
+  __slots__ = ("lhs", "rhs")
+
   def __init__(self, e1, e2):
     self.lhs = expr(e1)
     self.rhs = expr(e2)
@@ -113,6 +138,8 @@ class AppExpr(Expr):
     return f"({self.lhs} {self.rhs})"
 
 class LambdaExpr(Expr):
+  __slots__ = ("vars", "expr")
+
   def __init__(self, vars, e1):
     self.vars = list(map(decl, vars))
     self.expr = expr(e1)
@@ -122,6 +149,7 @@ class LambdaExpr(Expr):
     return f"\\({parms}).{self.expr}"
 
 class CallExpr(Expr):
+  __slots__ = ("fn", "args")
 
   def __init__(self, fn, args):
     self.fn = expr(fn)
@@ -132,6 +160,8 @@ class CallExpr(Expr):
     return f"{self.fn} ({args})"
 
 class PlaceholderExpr(Expr):
+  __slots__ = ()
+
   def __str__(self):
     return "_"
 
@@ -379,11 +409,33 @@ def reduce(e):
 
 #Evaluate
 
+class Env:
+  # An immutable frame of bindings linked to the frame it extends. Frames
+  # are shared, never copied: capturing one is O(1) and extending one costs
+  # only the new bindings.
+  __slots__ = ("bindings", "parent")
+
+  def __init__(self, bindings = None, parent = None):
+    self.bindings = bindings or {}
+    self.parent = parent
+
+  def extend(self, bindings):
+    return Env(bindings, self)
+
+  def __getitem__(self, var):
+    env = self
+    while env is not None:
+      if var in env.bindings:
+        return env.bindings[var]
+      env = env.parent
+    raise KeyError(var)
+
 class Closure:
+  __slots__ = ("abs", "env")
 
   def __init__(self, abs, env):
     self.abs = abs
-    self.env = clone(env)
+    self.env = env
 
 def eval_bool(e, store):
 
@@ -401,10 +453,10 @@ def eval_not(e, store):
   return not evaluate(e.expr, store)
 
 def eval_cond(e, store):
-  if evaluate(e.cond):
-    return evaluate(e.true);
+  if evaluate(e.cond, store):
+    return evaluate(e.true, store);
   else:
-    return evaluate(e.false);
+    return evaluate(e.false, store);
 
 def eval_id(e, store):
  
@@ -423,7 +475,7 @@ def eval_app(e, store):
 
   v = evaluate(e.rhs, store)
 
-  return evaluate(c.abs.expr, c.env + {c.abs.var: v})
+  return evaluate(c.abs.expr, c.env.extend({c.abs.var: v}))
 
 def eval_lambda(e, store):
   
@@ -439,13 +491,10 @@ def eval_call(e, store):
   for a in e.args:
     args += [evaluate(a, store)]
 
-  env = clone(c.env)
-  for i in range(len(args)):
-    env[c.abs.vars[i]] = args[i]
-
+  env = c.env.extend(dict(zip(c.abs.vars, args)))
   return evaluate(c.abs.expr, env)
 
-def evaluate(e, store = {}):
+def evaluate(e, store = Env()):
 
 
   if type(e) is BoolExpr:
@@ -460,6 +509,9 @@ def evaluate(e, store = {}):
   if type(e) is NotExpr:
     return eval_not(e, store)
 
+  if type(e) is IfExpr:
+    return eval_cond(e, store)
+
   if type(e) is IdExpr:
     return eval_id(e, store)
 
@@ -474,3 +526,83 @@ def evaluate(e, store = {}):
 
   if type(e) is CallExpr:
     return eval_call(e, store)
+
+#Batch
+
+# Evaluates a lambda over Bool parameters for every assignment of its
+# parameters at once. Each value is a bit vector held in a Python int, with
+# bit i giving the value under assignment i, in which parameter j is true
+# exactly when bit j of i is set. One & or | then computes an operator for
+# all 2^n assignments, instead of one tree walk per assignment.
+
+def batch_vars(n):
+  # The bit vector of each of n parameters, over 2^n assignments.
+  size = 1 << n
+  ones = (1 << size) - 1
+  vs = []
+  for j in range(n):
+    w = 1 << j
+    # 2^j zeros then 2^j ones, doubled until it fills the vector.
+    x = ((1 << w) - 1) << w
+    k = 2 * w
+    while k < size:
+      x |= x << k
+      k *= 2
+    vs += [x]
+  return vs, ones
+
+def batch_eval(e, store, ones):
+
+  if type(e) is BoolExpr:
+    return ones if e.val else 0
+
+  if type(e) is AndExpr:
+    return batch_eval(e.lhs, store, ones) & batch_eval(e.rhs, store, ones)
+
+  if type(e) is OrExpr:
+    return batch_eval(e.lhs, store, ones) | batch_eval(e.rhs, store, ones)
+
+  if type(e) is NotExpr:
+    return ~batch_eval(e.expr, store, ones) & ones
+
+  if type(e) is IfExpr:
+    c = batch_eval(e.cond, store, ones)
+    t = batch_eval(e.true, store, ones)
+    f = batch_eval(e.false, store, ones)
+    return (c & t) | (~c & f & ones)
+
+  if type(e) is IdExpr:
+    return store[e.ref]
+
+  if type(e) is AbsExpr or type(e) is LambdaExpr:
+    return Closure(e, store)
+
+  if type(e) is AppExpr:
+    c = batch_eval(e.lhs, store, ones)
+    if type(c) is not Closure:
+      raise Exception("cannot apply a non-closure to an argument")
+    v = batch_eval(e.rhs, store, ones)
+    return batch_eval(c.abs.expr, c.env.extend({c.abs.var: v}), ones)
+
+  if type(e) is CallExpr:
+    c = batch_eval(e.fn, store, ones)
+    if type(c) is not Closure:
+      raise Exception("cannot apply a non-closure to an argument")
+    args = [batch_eval(a, store, ones) for a in e.args]
+    return batch_eval(c.abs.expr, c.env.extend(dict(zip(c.abs.vars, args))), ones)
+
+  assert False
+
+def truth_table(fn):
+  # The packed truth table of a resolved lambda over Bool parameters.
+  if type(fn) is not LambdaExpr:
+    raise Exception("truth table of a non-lambda")
+  for var in fn.vars:
+    if type(var.type) is not BoolType:
+      raise Exception("truth table of a non-Bool parameter")
+
+  vs, ones = batch_vars(len(fn.vars))
+  return batch_eval(fn.expr, Env(dict(zip(fn.vars, vs))), ones)
+
+def truth_row(table, i):
+  return bool(table >> i & 1)
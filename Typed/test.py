@@ -1,11 +1,34 @@
 from lang import *
+import copy
+
+clone = copy.deepcopy
 
 impl = \
   LambdaExpr([VarDecl("p", boolType), VarDecl("q", boolType)], OrExpr(NotExpr("p"), "q"))
 
+# Each row of a packed truth table against evaluating that row on its own.
+def choice():
+  ps = [VarDecl(f"p{j}", boolType) for j in range(5)]
+  return LambdaExpr(ps, IfExpr("p0", AndExpr("p1", NotExpr("p2")), OrExpr("p3", AndExpr("p4", "p1"))))
+
+bits = truth_table(resolve(choice()))
+for i in range(1 << 5):
+  args = [bool(i >> j & 1) for j in range(5)]
+  assert evaluate(resolve(CallExpr(choice(), args))) == truth_row(bits, i)
+print(f"truth table of {choice()}: {bits:032b}")
+
 table = [
   resolve(CallExpr(clone(impl), [True, True])),
   resolve(CallExpr(clone(impl), [True, False])),
   resolve(CallExpr(clone(impl), [False, True])),
   resolve(CallExpr(clone(impl), [False, False]))
 ]
+
+# All four rows at once: bit i is the value with p = bit 0 of i and
+# q = bit 1 of i.
+bits = truth_table(resolve(clone(impl)))
+for i in range(4):
+  p, q = bool(i & 1), bool(i & 2)
+  assert truth_row(bits, i) == evaluate(resolve(CallExpr(clone(impl), [p, q])))
+  assert truth_row(bits, i) == (not p or q)
+  print(f"p={p} q={q}: {truth_row(bits, i)}")